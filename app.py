@@ -9,9 +9,14 @@ from starlette.responses import JSONResponse
 from model.dto import ResData
 from exceptions import BusinessException
 from core.redis import get_redis_pool
-from core.config import HOST
+from core.config import HOST, WEB_WORKERS, RAG_LLM_MODEL, RAG_EMBEDDING_MODEL, CODE_EMBEDDING_MODEL, MODEL_WARMUP, WHISPER_MODEL
 import redis
+import asyncio
 from core.executor import executor
+from core.model_registry import model_registry
+from core.whisper_model_pool import whisper_model_pool
+from core.chunked_transcriber import chunked_transcriber
+from core.http_client import http_client
 
 
 
@@ -51,6 +56,12 @@ async def exception_handler(request: Request, exc: Exception):
 async def startup_event():
     logger = get_logger()
     app.state.redis: redis.Redis = get_redis_pool()
+    app.state.model_registry = model_registry
+    # 在线程中加载模型，避免阻塞事件循环
+    await asyncio.get_running_loop().run_in_executor(
+        None, model_registry.warmup, [RAG_LLM_MODEL], [RAG_EMBEDDING_MODEL, CODE_EMBEDDING_MODEL], MODEL_WARMUP)
+    if MODEL_WARMUP:
+        await asyncio.get_running_loop().run_in_executor(None, whisper_model_pool.warmup, [WHISPER_MODEL])
     logger.info("fastapi start")
 
 
@@ -59,10 +70,12 @@ async def shutdown_event():
     logger = get_logger()
     app.state.redis.connection_pool.disconnect()
     logger.info("Redis disconnected")
+    http_client.close()
+    chunked_transcriber.close()
     executor.shutdown()
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app="app:app", host=HOST, port=8000, workers=4)
+    uvicorn.run(app="app:app", host=HOST, port=8000, workers=WEB_WORKERS)
@@ -0,0 +1,3 @@
+from core.config import DATA_PATH
+
+DOWNLOAD_CATALOG_PATH = f"{DATA_PATH}/download/catalog.db"
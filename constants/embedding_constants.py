@@ -0,0 +1,3 @@
+from core.config import DATA_PATH
+
+EMBEDDING_CACHE_PATH = f"{DATA_PATH}/embedding/embedding_cache.db"
@@ -3,3 +3,11 @@ from core.config import DATA_PATH
 RAG_PERSIST_DIR = f"{DATA_PATH}/rag/rag_persist_dir"
 RAG_PDF_DIR = f"{DATA_PATH}/rag/pdf"
 RAG_TASK_REDIS_PREFIX = f"RAG_TASK"
+RAG_INDEX_JOB_EXPIRE = 3600
+# 构建锁的过期时间，构建期间按 1/3 间隔续期，构建进程退出后等待的任务在此时间后接手
+RAG_INDEX_LOCK_EXPIRE = 60
+RAG_INDEX_JOB_END_STATUS = ("FINISHED", "FAILED")
+RAG_TASK_END_STATUS = ("finished", "failed")
+RAG_HEARTBEAT_INTERVAL = 5
+RAG_QUERY_MODE_DIRECT = "direct"
+RAG_QUERY_MODE_AGENT = "agent"
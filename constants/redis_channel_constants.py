@@ -1,2 +1,5 @@
 
-WHISPER_STATUS_CHANNEL = "anynote_ai_fastapi:whisper_status_channel:id"
\ No newline at end of file
+WHISPER_STATUS_CHANNEL = "anynote_ai_fastapi:whisper_status_channel:id"
+RAG_INDEX_JOB_STATUS_CHANNEL = "anynote_ai_fastapi:rag_index_job_status_channel:id"
+
+RAG_TASK_STATUS_CHANNEL = "anynote_ai_fastapi:rag_task_status_channel:id"
@@ -1,2 +1,11 @@
 
-WHISPER_STATUS = "anynote_ai_fastapi:whisper_status:id"
\ No newline at end of file
+WHISPER_STATUS = "anynote_ai_fastapi:whisper_status:id"
+RAG_INDEX_JOB_STATUS = "anynote_ai_fastapi:rag_index_job_status:id"
+RAG_INDEX_LOCK = "anynote_ai_fastapi:rag_index_lock:hash"
+RAG_INDEX_FOLLOWERS = "anynote_ai_fastapi:rag_index_followers:hash"
+RAG_INDEX_GENERATION = "anynote_ai_fastapi:rag_index_generation:hash"
+RAG_ANSWER_CACHE = "anynote_ai_fastapi:rag_answer_cache:key"
+RAG_ANSWER_SEMANTIC_CACHE = "anynote_ai_fastapi:rag_answer_semantic_cache:key"
+WHISPER_TRANSCRIPT_CACHE = "anynote_ai_fastapi:whisper_transcript_cache:key"
+WHISPER_TRANSCRIPT_LOCK = "anynote_ai_fastapi:whisper_transcript_lock:key"
+WHISPER_TRANSCRIPT_FOLLOWERS = "anynote_ai_fastapi:whisper_transcript_followers:key"
@@ -9,3 +9,7 @@ WHISPER_TXT_DIR = f"{DATA_PATH}/whisper/txt"
 WHISPER_MINIO_SRT_DIR = "whisper/srt"
 WHISPER_MINIO_TXT_DIR = "whisper/txt"
 
+
+# 转写锁的过期时间，转写期间按 1/3 间隔续期，转写进程退出后等待的任务在此时间后接手
+WHISPER_TRANSCRIPT_LOCK_EXPIRE = 60
+WHISPER_END_STATUS = ("FINISHED", "FAILED")
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, Request
 
 from service.rag_service import RagService
-from model.dto import RagFileIndexDTO, ResData, RagQueryDTO, GithubQueryDTO
+from model.dto import RagFileIndexDTO, ResData, RagQueryDTO, GithubQueryDTO, RagMultiQueryDTO
 from core.redis_server import RedisServer
+from core.index_cache import index_cache
 from fastapi.responses import StreamingResponse
 import uuid
 
@@ -19,6 +20,32 @@ def index(request: Request, data: RagFileIndexDTO, service: RagService = Depends
     return ResData.success(rag_file_index_vo.to_dict())
 
 
+@rag_router.post("/api/rag/index/submit")
+def index_submit(request: Request, data: RagFileIndexDTO, service: RagService = Depends(get_rag_service)):
+    return ResData.success(service.submit_index_job(data).to_dict())
+
+
+@rag_router.get("/api/rag/index/job/{job_id}")
+def index_job(request: Request, job_id: str, service: RagService = Depends(get_rag_service)):
+    return ResData.success(service.get_index_job(job_id))
+
+
+@rag_router.get("/api/rag/index/job/{job_id}/stream")
+async def index_job_stream(request: Request, job_id: str, service: RagService = Depends(get_rag_service)):
+    headers = {
+        # 设置返回数据类型是SSE
+        'Content-Type': 'text/event-stream;charset=UTF-8',
+        # 保证客户端的数据是新的
+        'Cache-Control': 'no-cache',
+    }
+    return StreamingResponse(service.get_index_job_stream(job_id), headers=headers)
+
+
+@rag_router.get("/api/rag/index/cache")
+def index_cache_stats(request: Request):
+    return ResData.success(index_cache.stats())
+
+
 @rag_router.post("/api/rag/github")
 def query_github(request: Request, data: GithubQueryDTO, service: RagService = Depends(get_rag_service)):
     return ResData.success(service.query_github(data).to_dict())
@@ -33,7 +60,7 @@ def github_index(request: Request, service: RagService = Depends(get_rag_service
 async def query(request: Request, data: RagQueryDTO, service: RagService = Depends(get_rag_service)):
     # rag_query_vo = service.query(data)
     task_id = uuid.uuid4().__str__()
-    service.query(data, task_id)
+    await service.query(data, task_id)
     headers = {
         # 设置返回数据类型是SSE
         'Content-Type': 'text/event-stream;charset=UTF-8',
@@ -55,3 +82,15 @@ async def query_v2(request: Request, data: RagQueryDTO, service: RagService = De
         'Cache-Control': 'no-cache',
     }
     return StreamingResponse(service.query_v2(data, task_id), headers=headers)
+
+
+@rag_router.post("/api/rag/query/multi")
+async def query_multi(request: Request, data: RagMultiQueryDTO, service: RagService = Depends(get_rag_service)):
+    task_id = uuid.uuid4().__str__()
+    headers = {
+        # 设置返回数据类型是SSE
+        'Content-Type': 'text/event-stream;charset=UTF-8',
+        # 保证客户端的数据是新的
+        'Cache-Control': 'no-cache',
+    }
+    return StreamingResponse(service.query_multi(data, task_id), headers=headers)
@@ -2,14 +2,16 @@ from concurrent.futures import ThreadPoolExecutor
 
 from fastapi import APIRouter, Depends, Request, BackgroundTasks
 from service.whisper_service import WhisperService
+from core.redis_server import RedisServer
+from core.transcription_scheduler import transcription_scheduler
 from model.dto import WhisperRunDTO, ResData
 from fastapi.responses import StreamingResponse
 
 whisper_router = APIRouter()
 
 
-def get_whisper_service() -> WhisperService:
-    return WhisperService()
+def get_whisper_service(request: Request) -> WhisperService:
+    return WhisperService(RedisServer(request.app.state.redis))
 
 
 @whisper_router.post('/api/whisper')
@@ -29,6 +31,11 @@ async def whisper_submit(request: Request, data: WhisperRunDTO, service: Whisper
     res = await service.submit_whisper_task(data)
     return ResData.success(res.to_dict())
 
+@whisper_router.get("/api/whisper/scheduler")
+async def whisper_scheduler_stats():
+    return ResData.success(transcription_scheduler.stats())
+
+
 @whisper_router.get("/api/whisper/{task_id}")
 async def whisper_get_task(request: Request, task_id: str, service: WhisperService = Depends(get_whisper_service)):
     headers = {
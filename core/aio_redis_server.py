@@ -37,6 +37,34 @@ class AIORedisServer:
         finally:
             await sub.unsubscribe(channel)
 
+    async def watch(self, channel: str, key: str, timeout: float | None = None):
+        """
+        先订阅频道再读取 key 的当前值，保证两者之间发布的消息不会丢失。
+        第一个结果为 key 的当前值（不存在时为 None），之后为频道中的消息。
+
+        :param channel: 要订阅的频道名称
+        :param key: 保存当前状态的 key
+        :param timeout: 超过该秒数没有消息时重复返回最近一次的值，可用作心跳
+        """
+        sub = self.redis.pubsub()
+        await sub.subscribe(channel)
+        try:
+            value = await self.redis.get(key)
+            data = json.loads(value) if value else None
+            yield data
+            if timeout is None:
+                async for message in sub.listen():
+                    if message['type'] == 'message':
+                        yield json.loads(message['data'])
+                return
+            while True:
+                message = await sub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+                if message is not None and message['type'] == 'message':
+                    data = json.loads(message['data'])
+                yield data
+        finally:
+            await sub.unsubscribe(channel)
+
     async def publish(self, channel: str, message):
         await self.redis.publish(channel, json.dumps(message))
 
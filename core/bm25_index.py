@@ -0,0 +1,107 @@
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+BM25_FILE_NAME = "bm25.npz"
+TOKEN_PATTERN = re.compile(r"(?P<cjk>[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)|(?P<word>[A-Za-z0-9_]+)")
+# 拆分驼峰和下划线命名的标识符
+IDENTIFIER_PART_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    中文按字的二元组切分，英文和代码标识符转小写，并额外加入驼峰、下划线拆分后的各部分
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        word = match.group()
+        if match.lastgroup == "cjk":
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+            continue
+        tokens.append(word.lower())
+        parts = IDENTIFIER_PART_PATTERN.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+class Bm25Index:
+    """
+    BM25 关键词倒排索引，倒排表以 CSR 形式保存：第 i 个词出现在 doc_ids[offsets[i]:offsets[i + 1]] 中，
+    对应的词频在 term_freqs 的相同位置。
+    """
+
+    def __init__(self, node_ids: list[str], terms: list[str], offsets: np.ndarray, doc_ids: np.ndarray,
+                 term_freqs: np.ndarray, doc_lengths: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        self.node_ids = node_ids
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self._term_ids = {term: i for i, term in enumerate(terms)}
+        average_length = float(doc_lengths.mean()) if len(doc_lengths) else 1.0
+        self._length_norms = (k1 * (1 - b + b * doc_lengths / max(average_length, 1.0))).astype(np.float32)
+
+    @classmethod
+    def build(cls, node_ids: list[str], texts: list[str]) -> "Bm25Index":
+        postings: dict[str, list[tuple[int, int]]] = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc_id] = len(tokens)
+            for term, freq in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, freq))
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        doc_ids = np.fromiter((doc_id for term in terms for doc_id, _ in postings[term]), dtype=np.int32,
+                              count=int(offsets[-1]))
+        term_freqs = np.fromiter((min(freq, 65535) for term in terms for _, freq in postings[term]), dtype=np.uint16,
+                                 count=int(offsets[-1]))
+        return cls(list(node_ids), terms, offsets, doc_ids, term_freqs, doc_lengths)
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, BM25_FILE_NAME))
+
+    def save(self, path: str):
+        terms = sorted(self._term_ids, key=self._term_ids.get)
+        with open(path, "wb") as f:
+            np.savez_compressed(f, node_ids=np.array(self.node_ids, dtype=str), terms=np.array(terms, dtype=str),
+                                offsets=self.offsets, doc_ids=self.doc_ids, term_freqs=self.term_freqs,
+                                doc_lengths=self.doc_lengths)
+
+    @classmethod
+    def load(cls, path: str) -> "Bm25Index":
+        with np.load(path) as data:
+            return cls(data["node_ids"].tolist(), data["terms"].tolist(), data["offsets"], data["doc_ids"],
+                       data["term_freqs"], data["doc_lengths"])
+
+    def search(self, query: str, top_k: int) -> list[tuple[str, float]]:
+        """
+        :return: 按 BM25 分数从高到低排列的 (node_id, 分数)
+        """
+        scores = np.zeros(len(self.node_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end].astype(np.float32)
+            idf = math.log(1 + (len(self.node_ids) - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + self._length_norms[docs])
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+        top_k = min(top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.node_ids[i], float(scores[i])) for i in top]
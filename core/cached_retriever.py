@@ -0,0 +1,70 @@
+import asyncio
+from typing import List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+
+from core.retrieval_cache import RetrievalCache
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    通过 RetrievalCache 复用问题向量和检索结果，命中时只需要从 docstore 读取节点
+    """
+
+    def __init__(self, retriever: BaseRetriever, retrieval_cache: RetrievalCache, persist_dir: str,
+                 embed_model: BaseEmbedding, docstore: BaseDocumentStore, similarity_top_k: int,
+                 callback_manager: Optional[CallbackManager] = None):
+        self._retriever = retriever
+        self._retrieval_cache = retrieval_cache
+        self._persist_dir = persist_dir
+        self._embed_model = embed_model
+        self._docstore = docstore
+        self._similarity_top_k = similarity_top_k
+        super().__init__(callback_manager=callback_manager)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            model = self._embed_model.model_name
+            embedding = self._retrieval_cache.get_embedding(model, query_bundle.query_str)
+            if embedding is None:
+                embedding = self._embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+                self._retrieval_cache.put_embedding(model, query_bundle.query_str, embedding)
+            query_bundle.embedding = embedding
+
+        result = self._retrieval_cache.get_result(self._persist_dir, query_bundle.embedding, self._similarity_top_k)
+        if result is not None:
+            return self._nodes_of(result)
+        nodes = self._retriever.retrieve(query_bundle)
+        self._put_result(query_bundle, nodes)
+        return nodes
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        """
+        问题向量通过 Embedding 模型的异步接口计算，检索和读取 docstore 在线程中执行，不阻塞事件循环
+        """
+        if query_bundle.embedding is None:
+            model = self._embed_model.model_name
+            embedding = self._retrieval_cache.get_embedding(model, query_bundle.query_str)
+            if embedding is None:
+                embedding = await self._embed_model.aget_agg_embedding_from_queries(query_bundle.embedding_strs)
+                self._retrieval_cache.put_embedding(model, query_bundle.query_str, embedding)
+            query_bundle.embedding = embedding
+
+        result = self._retrieval_cache.get_result(self._persist_dir, query_bundle.embedding, self._similarity_top_k)
+        if result is not None:
+            return await asyncio.to_thread(self._nodes_of, result)
+        nodes = await asyncio.to_thread(self._retriever.retrieve, query_bundle)
+        self._put_result(query_bundle, nodes)
+        return nodes
+
+    def _nodes_of(self, result: list[tuple[str, float]]) -> List[NodeWithScore]:
+        nodes = self._docstore.get_nodes([node_id for node_id, _ in result])
+        return [NodeWithScore(node=node, score=score) for node, (_, score) in zip(nodes, result)]
+
+    def _put_result(self, query_bundle: QueryBundle, nodes: List[NodeWithScore]):
+        self._retrieval_cache.put_result(self._persist_dir, query_bundle.embedding, self._similarity_top_k,
+                                         [(node.node.node_id, node.score) for node in nodes])
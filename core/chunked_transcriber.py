@@ -0,0 +1,168 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import SAMPLE_RATE
+
+from core.config import WHISPER_CHUNK_PROCESSES, WHISPER_TORCH_THREADS, WHISPER_CHUNK_SECONDS
+
+# 在每段结尾前的这段时间内寻找最安静的位置切分
+SILENCE_SEARCH_SECONDS = 30
+# 计算能量的帧长，20ms
+FRAME_SIZE = SAMPLE_RATE // 50
+
+# 子进程内按名称缓存的模型
+_models = {}
+
+
+def init_worker(torch_threads: int):
+    torch.set_num_threads(torch_threads)
+
+
+def get_model(model_name: str):
+    model = _models.get(model_name)
+    if model is None:
+        model = whisper.load_model(model_name, device="cuda" if torch.cuda.is_available() else "cpu")
+        _models[model_name] = model
+    return model
+
+
+def detect_language(audio_path: str, start: int, end: int, model_name: str) -> str:
+    """
+    在子进程中检测一段音频的语言，只使用开头 30 秒
+    """
+    model = get_model(model_name)
+    audio = whisper.pad_or_trim(np.ascontiguousarray(np.load(audio_path, mmap_mode="r")[start:end]))
+    mel = whisper.log_mel_spectrogram(audio, model.dims.n_mels).to(model.device)
+    _, probs = model.detect_language(mel)
+    return max(probs, key=probs.get)
+
+
+def transcribe_chunk(audio_path: str, start: int, end: int, language: str | None, model_name: str) -> dict:
+    """
+    在子进程中转写一段音频，时间戳加上该段在整段音频中的偏移
+
+    :param audio_path: 解码后的 16kHz 单声道 float32 音频(.npy)
+    :param start: 起始采样点
+    :param end: 结束采样点
+    """
+    model = get_model(model_name)
+    audio = np.ascontiguousarray(np.load(audio_path, mmap_mode="r")[start:end])
+    return offset_result(model.transcribe(audio, language=language), start)
+
+
+def offset_result(result: dict, start: int) -> dict:
+    """
+    只保留拼接需要的字段，时间戳加上分段起始采样点对应的偏移
+    """
+    offset = start / SAMPLE_RATE
+    return {
+        "text": result["text"],
+        "segments": [{"start": segment["start"] + offset, "end": segment["end"] + offset, "text": segment["text"]}
+                     for segment in result["segments"]]
+    }
+
+
+def split_at_silence(audio: np.ndarray, chunk_seconds: float,
+                     search_seconds: float = SILENCE_SEARCH_SECONDS) -> list[tuple[int, int]]:
+    """
+    把音频切分成不超过 chunk_seconds 的片段，切分点取每段结尾前 search_seconds 内能量最低的帧
+
+    :return: [(起始采样点, 结束采样点)]
+    """
+    max_samples = int(chunk_seconds * SAMPLE_RATE)
+    search_samples = min(int(search_seconds * SAMPLE_RATE), max_samples // 2)
+    chunks = []
+    start = 0
+    while len(audio) - start > max_samples:
+        window_start = start + max_samples - search_samples
+        window = np.asarray(audio[window_start:start + max_samples])
+        frames = len(window) // FRAME_SIZE
+        energy = np.square(window[:frames * FRAME_SIZE].reshape(frames, FRAME_SIZE)).mean(axis=1)
+        cut = window_start + int(np.argmin(energy)) * FRAME_SIZE + FRAME_SIZE // 2
+        chunks.append((start, cut))
+        start = cut
+    chunks.append((start, len(audio)))
+    return chunks
+
+
+class TranscriptStitcher:
+    """
+    按顺序拼接各段的转写结果。各段在静音处切分且互不重叠，不需要去重
+    """
+
+    def __init__(self):
+        self.segments = []
+
+    def add(self, result: dict) -> list[dict]:
+        """
+        :return: 本次新增的片段
+        """
+        chunk_segments = list(result["segments"])
+        self.segments.extend(chunk_segments)
+        return chunk_segments
+
+    def prompt(self, max_chars: int = 200) -> str | None:
+        """
+        已转写文本的结尾，作为下一段的 initial_prompt 保持上下文
+        """
+        text = "".join(segment["text"] for segment in self.segments[-10:]).strip()
+        return text[-max_chars:] or None
+
+    def result(self) -> dict:
+        return {"text": "".join(segment["text"] for segment in self.segments), "segments": self.segments}
+
+
+def stitch(results: list[dict]) -> dict:
+    stitcher = TranscriptStitcher()
+    for result in results:
+        stitcher.add(result)
+    return stitcher.result()
+
+
+class ChunkedTranscriber:
+    """
+    长音频分段转写。音频解码一次后按静音位置切分，各段在进程池中并行转写。
+    每个子进程加载自己的模型副本，使用 torch_threads 个计算线程。子进程中的模型不属于 whisper_model_pool，
+    副本数由进程数 WHISPER_CHUNK_PROCESSES 单独限制；CPU 核数由调用方通过 TranscriptionScheduler.reserve 申请。
+    """
+
+    def __init__(self, processes: int, torch_threads: int, chunk_seconds: float):
+        self.processes = processes
+        self.torch_threads = torch_threads
+        self.chunk_seconds = chunk_seconds
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # torch 的线程状态在 fork 后不可用，使用 spawn 启动子进程
+                self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=init_worker, initargs=(self.torch_threads,))
+            return self._executor
+
+    def split(self, audio: np.ndarray) -> list[tuple[int, int]]:
+        return split_at_silence(audio, self.chunk_seconds)
+
+    def detect_language(self, audio_path: str, chunk: tuple[int, int], model_name: str) -> Future:
+        return self._get_executor().submit(detect_language, audio_path, chunk[0], chunk[1], model_name)
+
+    def submit(self, audio_path: str, chunks: list[tuple[int, int]], language: str | None,
+               model_name: str) -> list[Future]:
+        executor = self._get_executor()
+        return [executor.submit(transcribe_chunk, audio_path, start, end, language, model_name)
+                for start, end in chunks]
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+chunked_transcriber = ChunkedTranscriber(WHISPER_CHUNK_PROCESSES, WHISPER_TORCH_THREADS, WHISPER_CHUNK_SECONDS)
@@ -0,0 +1,177 @@
+import json
+import os
+from typing import Dict, Optional
+
+import fsspec
+from llama_index.core.schema import BaseNode, NodeRelationship
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.docstore.utils import json_to_doc
+from llama_index.core.storage.kvstore import SimpleKVStore
+
+COMPACT_DOCSTORE_FILE_NAME = "compact_docstore.json"
+COMPACT_DOCSTORE_VERSION = 1
+# 查找窗口边界时向前最多检查的句子数
+MAX_WINDOW_SIZE = 16
+
+
+def find_window(sentences: list[str], position: int, window: str) -> tuple[int, int] | None:
+    """
+    在句子数组中找出拼接结果与 window 完全一致的区间
+
+    :param sentences: 文档的句子数组
+    :param position: 当前节点句子的位置
+    :param window: 节点的 window 元数据
+    :return: (start, end)，找不到时为 None
+    """
+    for start in range(position, max(-1, position - MAX_WINDOW_SIZE - 1), -1):
+        prefix = " ".join(sentences[start:position + 1])
+        if not window.startswith(prefix):
+            continue
+        offset = len(prefix)
+        end = position + 1
+        while offset < len(window) and end < len(sentences):
+            part = " " + sentences[end]
+            if not window.startswith(part, offset):
+                break
+            offset += len(part)
+            end += 1
+        if offset == len(window):
+            return start, end
+    return None
+
+
+class CompactDocumentStore(SimpleDocumentStore):
+    """
+    句子窗口节点的紧凑 docstore。每个文档的句子只保存一次，节点只记录句子位置和窗口区间，
+    text、window 和 original_text 在读取节点时再拼出来。无法还原出完全一致窗口的节点按原格式保存。
+    """
+
+    def __init__(self, simple_kvstore: Optional[SimpleKVStore] = None, documents: Optional[dict] = None,
+                 nodes: Optional[dict] = None, window_metadata_key: str = "window",
+                 original_text_metadata_key: str = "original_text", **kwargs):
+        super().__init__(simple_kvstore=simple_kvstore, **kwargs)
+        self._documents = documents or {}
+        self._compact_nodes = nodes or {}
+        self._window_metadata_key = window_metadata_key
+        self._original_text_metadata_key = original_text_metadata_key
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, COMPACT_DOCSTORE_FILE_NAME))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, namespace: Optional[str] = None,
+                         fs: Optional[fsspec.AbstractFileSystem] = None) -> "CompactDocumentStore":
+        fs = fs or fsspec.filesystem("file")
+        with fs.open(os.path.join(persist_dir, COMPACT_DOCSTORE_FILE_NAME), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(simple_kvstore=SimpleKVStore.from_dict(data["kv"]), documents=data["documents"],
+                   nodes=data["nodes"], namespace=namespace)
+
+    def _inflate(self, node_id: str) -> dict:
+        compact_node = self._compact_nodes[node_id]
+        document = self._documents[compact_node["doc"]]
+        sentences = document["sentences"]
+        start, end = compact_node["window"]
+        data = dict(compact_node["__data__"])
+        data["text"] = sentences[compact_node["sentence"]]
+        metadata = dict(data.get("metadata", document["metadata"]))
+        metadata[self._window_metadata_key] = " ".join(sentences[start:end])
+        metadata[self._original_text_metadata_key] = data["text"]
+        data["metadata"] = metadata
+        return {"__type__": compact_node["__type__"], "__data__": data}
+
+    def _materialize(self):
+        """
+        修改 docstore 前把紧凑节点展开回 kvstore，之后的操作沿用 SimpleDocumentStore 的实现
+        """
+        for node_id in list(self._compact_nodes):
+            self._kvstore.put(node_id, self._inflate(node_id), collection=self._node_collection)
+        self._compact_nodes = {}
+        self._documents = {}
+
+    @property
+    def docs(self) -> Dict[str, BaseNode]:
+        docs = super().docs
+        for node_id in self._compact_nodes:
+            docs[node_id] = json_to_doc(self._inflate(node_id))
+        return docs
+
+    def get_document(self, doc_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        if doc_id in self._compact_nodes:
+            return json_to_doc(self._inflate(doc_id))
+        return super().get_document(doc_id, raise_error=raise_error)
+
+    async def aget_document(self, doc_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        return self.get_document(doc_id, raise_error=raise_error)
+
+    def document_exists(self, doc_id: str) -> bool:
+        return doc_id in self._compact_nodes or super().document_exists(doc_id)
+
+    def add_documents(self, *args, **kwargs) -> None:
+        self._materialize()
+        super().add_documents(*args, **kwargs)
+
+    def delete_document(self, *args, **kwargs) -> None:
+        self._materialize()
+        super().delete_document(*args, **kwargs)
+
+    def delete_ref_doc(self, *args, **kwargs) -> None:
+        self._materialize()
+        super().delete_ref_doc(*args, **kwargs)
+
+    def _compact(self) -> dict:
+        kv = {collection: dict(values) for collection, values in self._kvstore.to_dict().items()}
+        raw_nodes = kv.pop(self._node_collection, {})
+        items = list(raw_nodes.items()) + [(node_id, self._inflate(node_id)) for node_id in self._compact_nodes]
+
+        # 按来源文档分组，保持节点的插入顺序即句子顺序
+        groups: dict[str, list] = {}
+        for node_id, node_json in items:
+            source = node_json["__data__"].get("relationships", {}).get(NodeRelationship.SOURCE.value)
+            groups.setdefault(source["node_id"] if source else None, []).append((node_id, node_json))
+
+        documents = {}
+        nodes = {}
+        raw = {}
+        for ref_doc_id, group in groups.items():
+            if ref_doc_id is None:
+                raw.update(group)
+                continue
+            sentences = [node_json["__data__"].get("text", "") for _, node_json in group]
+            document_metadata = None
+            for position, (node_id, node_json) in enumerate(group):
+                data = dict(node_json["__data__"])
+                metadata = dict(data.get("metadata", {}))
+                window = metadata.pop(self._window_metadata_key, None)
+                original_text = metadata.pop(self._original_text_metadata_key, None)
+                bounds = None
+                if isinstance(window, str) and original_text == data.get("text"):
+                    bounds = find_window(sentences, position, window)
+                if bounds is None:
+                    raw[node_id] = node_json
+                    continue
+                if document_metadata is None:
+                    document_metadata = metadata
+                del data["text"]
+                if metadata == document_metadata:
+                    del data["metadata"]
+                else:
+                    data["metadata"] = metadata
+                nodes[node_id] = {"__type__": node_json["__type__"], "__data__": data, "doc": ref_doc_id,
+                                  "sentence": position, "window": list(bounds)}
+            if document_metadata is not None:
+                documents[ref_doc_id] = {"sentences": sentences, "metadata": document_metadata}
+        kv[self._node_collection] = raw
+        return {"version": COMPACT_DOCSTORE_VERSION, "kv": kv, "documents": documents, "nodes": nodes}
+
+    def persist(self, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> None:
+        """
+        StorageContext 传入的是 docstore.json 的路径，紧凑格式写到同一目录下的 compact_docstore.json
+        """
+        fs = fs or fsspec.filesystem("file")
+        persist_dir = os.path.dirname(persist_path)
+        if not fs.exists(persist_dir):
+            fs.makedirs(persist_dir)
+        with fs.open(os.path.join(persist_dir, COMPACT_DOCSTORE_FILE_NAME), "w", encoding="utf-8") as f:
+            json.dump(self._compact(), f, ensure_ascii=False)
@@ -22,3 +22,44 @@ ROCKETMQ_TOPIC = os.environ.get("ROCKETMQ_TOPIC")
 ROCKETMQ_NAMESERVER_ADDRESS = os.environ.get("ROCKETMQ_NAMESERVER_ADDRESS")
 ROCKETMQ_ACCESS_KEY = os.environ.get("ROCKETMQ_ACCESS_KEY")
 ROCKETMQ_ACCESS_SECRET = os.environ.get("ROCKETMQ_ACCESS_SECRET")
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "false").lower() == "true"
+INDEX_CACHE_MAX_BYTES = int(os.environ.get("INDEX_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+VECTOR_STORE_FORMAT = os.environ.get("VECTOR_STORE_FORMAT", "npy")
+DOCSTORE_FORMAT = os.environ.get("DOCSTORE_FORMAT", "compact")
+RAG_INDEX_WORKERS = int(os.environ.get("RAG_INDEX_WORKERS", 2))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 20))
+DOWNLOAD_CONNECT_TIMEOUT = float(os.environ.get("DOWNLOAD_CONNECT_TIMEOUT", 10))
+DOWNLOAD_READ_TIMEOUT = float(os.environ.get("DOWNLOAD_READ_TIMEOUT", 60))
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", 1024 * 1024))
+DOWNLOAD_MAX_SIZE = int(os.environ.get("DOWNLOAD_MAX_SIZE", 4 * 1024 * 1024 * 1024))
+DOWNLOAD_MAX_RETRIES = int(os.environ.get("DOWNLOAD_MAX_RETRIES", 3))
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_BATCH_WAIT_MS = float(os.environ.get("EMBEDDING_BATCH_WAIT_MS", 5))
+RAG_ANSWER_CACHE_TTL = int(os.environ.get("RAG_ANSWER_CACHE_TTL", 24 * 3600))
+RAG_ANSWER_CACHE_SEMANTIC = os.environ.get("RAG_ANSWER_CACHE_SEMANTIC", "false").lower() == "true"
+RAG_ANSWER_CACHE_SIMILARITY = float(os.environ.get("RAG_ANSWER_CACHE_SIMILARITY", 0.95))
+RAG_ANSWER_CACHE_SEMANTIC_MAX_ENTRIES = int(os.environ.get("RAG_ANSWER_CACHE_SEMANTIC_MAX_ENTRIES", 500))
+RAG_SIMILARITY_TOP_K = int(os.environ.get("RAG_SIMILARITY_TOP_K", 10))
+RAG_RETRIEVAL_WORKERS = int(os.environ.get("RAG_RETRIEVAL_WORKERS", 8))
+RAG_CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", 3000))
+ANN_MIN_NODES = int(os.environ.get("ANN_MIN_NODES", 20000))
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", 8))
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "none")
+VECTOR_RESCORE_FACTOR = int(os.environ.get("VECTOR_RESCORE_FACTOR", 4))
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", 60))
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.environ.get("RETRIEVAL_CACHE_MAX_ENTRIES", 10000))
+# uvicorn 的工作进程数；每个进程各自持有转写调度器、模型池和分段子进程池，下面的 WHISPER_* 名额都按单个进程计算
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", 4))
+WHISPER_CORES_PER_PROCESS = max(1, (os.cpu_count() or 1) // WEB_WORKERS)
+WHISPER_TORCH_THREADS = int(os.environ.get("WHISPER_TORCH_THREADS", min(4, WHISPER_CORES_PER_PROCESS)))
+WHISPER_WORKERS = int(os.environ.get("WHISPER_WORKERS", max(1, WHISPER_CORES_PER_PROCESS // WHISPER_TORCH_THREADS)))
+WHISPER_QUEUE_SIZE = int(os.environ.get("WHISPER_QUEUE_SIZE", 100))
+WHISPER_MODEL_MAX_COPIES = int(os.environ.get("WHISPER_MODEL_MAX_COPIES", WHISPER_WORKERS))
+WHISPER_LONG_MEDIA_SECONDS = int(os.environ.get("WHISPER_LONG_MEDIA_SECONDS", 600))
+WHISPER_CHUNK_SECONDS = int(os.environ.get("WHISPER_CHUNK_SECONDS", 300))
+WHISPER_SEGMENT_CHUNK_SECONDS = int(os.environ.get("WHISPER_SEGMENT_CHUNK_SECONDS", 60))
+# 分段转写的子进程数，每个子进程持有一个模型副本；不超过转写调度器的计算名额数
+WHISPER_CHUNK_PROCESSES = min(int(os.environ.get("WHISPER_CHUNK_PROCESSES", WHISPER_WORKERS)), WHISPER_WORKERS)
+WHISPER_TRANSCRIPT_CACHE_EXPIRE = int(os.environ.get("WHISPER_TRANSCRIPT_CACHE_EXPIRE", 30 * 24 * 3600))
@@ -0,0 +1,132 @@
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+import tiktoken
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode, MetadataMode
+from llama_index.core.utils import get_tokenizer
+
+# 查找重叠位置时使用的前缀长度
+OVERLAP_PROBE_LENGTH = 32
+# 句子窗口用空格拼接，与原文的空白不完全一致，首尾位置相差在这个字符数以内视为相邻
+ADJACENT_GAP_CHARS = 2
+
+
+@lru_cache
+def get_model_tokenizer(model: str | None) -> Callable[[str], list]:
+    """
+    目标 LLM 的分词器，tiktoken 不认识的模型使用 llama_index 的默认分词器
+    """
+    try:
+        return tiktoken.encoding_for_model(model).encode
+    except (KeyError, TypeError):
+        return get_tokenizer()
+
+
+def window_span(node: NodeWithScore) -> tuple[int, int] | None:
+    """
+    句子窗口在文档中的大致位置，由原句的起始位置和原句在窗口中的位置推算
+    """
+    text = node.node.get_content()
+    original_text = node.node.metadata.get("original_text")
+    if node.node.start_char_idx is None or not original_text or original_text not in text:
+        return None
+    start = node.node.start_char_idx - text.index(original_text)
+    return start, start + len(text)
+
+
+def merge_overlap(text: str, other: str) -> str | None:
+    """
+    合并两段有重叠的文本，other 包含在 text 中或 text 的结尾与 other 的开头重叠时返回合并后的文本，否则返回 None
+    """
+    if other in text:
+        return text
+    if text in other:
+        return other
+    probe = other[:OVERLAP_PROBE_LENGTH]
+    position = text.find(probe)
+    while position != -1:
+        if other.startswith(text[position:]):
+            return text[:position] + other
+        position = text.find(probe, position + 1)
+    return None
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    合并同一文档中相互重叠或首尾相接的句子窗口并按在文档中的位置排序，再按相似度在 token 预算内选择上下文，
+    token 数按 model 的分词器计算。需要放在 MetadataReplacementPostProcessor 之后。
+    """
+
+    token_budget: int
+    model: Optional[str] = None
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def _merge_document(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        nodes = sorted(nodes, key=lambda node: node.node.start_char_idx or 0)
+        segments: List[NodeWithScore] = []
+        last_end = None
+        for node in nodes:
+            text = node.node.get_content()
+            span = window_span(node)
+            if segments:
+                last = segments[-1]
+                merged = merge_overlap(last.node.get_content(), text)
+                if merged is None and span is not None and last_end is not None \
+                        and abs(span[0] - last_end) <= ADJACENT_GAP_CHARS:
+                    merged = f"{last.node.get_content()} {text}"
+                if merged is not None:
+                    last.node.set_content(merged)
+                    last.score = max(last.score or 0, node.score or 0)
+                    if span is None:
+                        last_end = None
+                    else:
+                        last_end = max(last_end or 0, span[1])
+                    continue
+            last_end = span[1] if span is not None else None
+            segment = TextNode(
+                id_=node.node.node_id,
+                text=text,
+                metadata=dict(node.node.metadata),
+                excluded_embed_metadata_keys=list(node.node.excluded_embed_metadata_keys),
+                excluded_llm_metadata_keys=list(node.node.excluded_llm_metadata_keys),
+                start_char_idx=node.node.start_char_idx,
+                relationships=dict(node.node.relationships)
+            )
+            segments.append(NodeWithScore(node=segment, score=node.score))
+        return segments
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        documents: dict[str, List[NodeWithScore]] = {}
+        for node in nodes:
+            documents.setdefault(node.node.ref_doc_id or "", []).append(node)
+        segments = [segment for document_nodes in documents.values()
+                    for segment in self._merge_document(document_nodes)]
+
+        # 按相似度从高到低放入预算
+        tokenizer = get_model_tokenizer(self.model)
+        remaining = self.token_budget
+        selected = []
+        for segment in sorted(segments, key=lambda segment: segment.score or 0, reverse=True):
+            tokens = len(tokenizer(segment.node.get_content(metadata_mode=MetadataMode.LLM)))
+            if tokens <= remaining:
+                selected.append(segment)
+                remaining -= tokens
+            elif not selected:
+                # 至少保留相似度最高的一段，按比例截断
+                text = segment.node.get_content()
+                segment.node.set_content(text[:max(1, len(text) * remaining // tokens)])
+                selected.append(segment)
+                remaining = 0
+
+        # 同一文档的片段按位置排列，文档之间按最高相似度排列
+        document_order = {}
+        for segment in selected:
+            document_order.setdefault(segment.node.ref_doc_id or "", len(document_order))
+        selected.sort(key=lambda segment: (document_order[segment.node.ref_doc_id or ""],
+                                           segment.node.start_char_idx or 0))
+        return selected
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+import time
+
+from constants.download_constants import DOWNLOAD_CATALOG_PATH
+
+
+class DownloadCatalog:
+    """
+    记录 URL 对应的 ETag/Last-Modified、内容哈希和本地文件路径，用于条件请求，避免重复下载未变化的文件。
+    本地路径只在当前机器有效，因此使用 SQLite 而不是 Redis 保存。
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS download_catalog ("
+            "url TEXT NOT NULL, "
+            "dest_folder TEXT NOT NULL, "
+            "etag TEXT, "
+            "last_modified TEXT, "
+            "hash_value TEXT NOT NULL, "
+            "file_path TEXT NOT NULL, "
+            "updated_at REAL NOT NULL, "
+            "PRIMARY KEY (url, dest_folder))"
+        )
+
+    def get(self, url: str, dest_folder: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, hash_value, file_path FROM download_catalog "
+                "WHERE url = ? AND dest_folder = ?", (url, dest_folder)).fetchone()
+        # 本地文件被删除后记录失效
+        if row is None or not os.path.exists(row[3]):
+            return None
+        return {
+            "etag": row[0],
+            "last_modified": row[1],
+            "hash_value": row[2],
+            "file_path": row[3]
+        }
+
+    def put(self, url: str, dest_folder: str, etag: str | None, last_modified: str | None,
+            hash_value: str, file_path: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO download_catalog "
+                "(url, dest_folder, etag, last_modified, hash_value, file_path, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, dest_folder, etag, last_modified, hash_value, file_path, time.time()))
+
+
+download_catalog = DownloadCatalog(DOWNLOAD_CATALOG_PATH)
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from constants.embedding_constants import EMBEDDING_CACHE_PATH
+from core.config import EMBEDDING_CACHE_MAX_BYTES
+from core.logger import get_logger
+
+
+def text_hash(text: str) -> str:
+    # 忽略空白字符差异
+    normalized_text = " ".join(text.split())
+    return hashlib.sha256(normalized_text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    以 (Embedding 模型名称, 文本哈希) 为 key 的磁盘向量缓存，超过容量时按最近访问时间淘汰。
+    """
+
+    # SQLite 的参数数量有上限，分批查询
+    QUERY_BATCH_SIZE = 500
+
+    def __init__(self, db_path: str, max_bytes: int):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.logger = get_logger()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "model TEXT NOT NULL, "
+            "text_hash TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, "
+            "last_access REAL NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embedding_cache_last_access ON embedding_cache (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._sum_bytes()
+
+    def _sum_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(LENGTH(embedding)), 0) FROM embedding_cache").fetchone()[0]
+
+    def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(hashes), self.QUERY_BATCH_SIZE):
+                batch = hashes[start:start + self.QUERY_BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, embedding FROM embedding_cache "
+                    f"WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})", [model, *batch]).fetchall()
+                found.update(rows)
+            if found:
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found])
+                self._conn.commit()
+        return [np.frombuffer(found[h], dtype=np.float32).tolist() if h in found else None for h in hashes]
+
+    def put_many(self, model: str, texts: list[str], embeddings: list[list[float]]):
+        now = time.time()
+        rows = [(model, text_hash(text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+                for text, embedding in zip(texts, embeddings)]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (model, text_hash, embedding, last_access) "
+                "VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._total_bytes += sum(len(row[2]) for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 多个进程共用同一个文件，淘汰前重新统计实际大小
+        total = self._sum_bytes()
+        self._total_bytes = total
+        if total <= self.max_bytes:
+            return
+        row_size = self._conn.execute("SELECT LENGTH(embedding) FROM embedding_cache LIMIT 1").fetchone()[0]
+        # 多淘汰 10%，避免每次写入都触发淘汰
+        count = int((total - self.max_bytes * 0.9) // max(row_size, 1)) + 1
+        self._conn.execute(
+            "DELETE FROM embedding_cache WHERE rowid IN "
+            "(SELECT rowid FROM embedding_cache ORDER BY last_access LIMIT ?)", (count,))
+        self._conn.commit()
+        self._total_bytes = self._sum_bytes()
+        self.logger.info(f"Embedding cache evicted {count} entries")
+
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES)
@@ -0,0 +1,128 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+from core.logger import get_logger
+
+TEXT = "text"
+QUERY = "query"
+
+
+class EmbeddingRequest:
+
+    def __init__(self, texts: list[str], kind: str):
+        self.texts = texts
+        self.kind = kind
+        self.future = Future()
+
+
+class EmbeddingEngine:
+    """
+    在独立线程中运行 Embedding 模型，把多个调用方的文本合并成批次计算后再通过 Future 分发结果。
+    批次大小不超过 max_batch_size，第一个请求最多等待 max_wait_ms。
+    """
+
+    def __init__(self, embed_model: BaseEmbedding, max_batch_size: int, max_wait_ms: float):
+        self.embed_model = embed_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.logger = get_logger()
+        self._queue: queue.Queue[EmbeddingRequest] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"embedding-engine-{embed_model.model_name}",
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: list[str], kind: str = TEXT) -> Future:
+        request = EmbeddingRequest(texts, kind)
+        self._queue.put(request)
+        return request.future
+
+    def embed(self, texts: list[str], kind: str = TEXT) -> list[list[float]]:
+        return self.submit(texts, kind).result()
+
+    def _collect(self) -> list[EmbeddingRequest]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _embed_queries(self, queries: list[str]) -> list[list[float]]:
+        if isinstance(self.embed_model, HuggingFaceEmbedding):
+            # 查询需要带上模型的检索指令
+            return self.embed_model._embed(queries, prompt_name="query")
+        return [self.embed_model.get_query_embedding(query) for query in queries]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            for kind in (TEXT, QUERY):
+                requests = [request for request in batch if request.kind == kind]
+                if not requests:
+                    continue
+                texts = [text for request in requests for text in request.texts]
+                try:
+                    if kind == QUERY:
+                        embeddings = self._embed_queries(texts)
+                    else:
+                        embeddings = self.embed_model.get_text_embedding_batch(texts)
+                except Exception as e:
+                    self.logger.exception("Embedding batch failed")
+                    for request in requests:
+                        request.future.set_exception(e)
+                    continue
+                offset = 0
+                for request in requests:
+                    request.future.set_result(embeddings[offset:offset + len(request.texts)])
+                    offset += len(request.texts)
+
+
+class BatchedEmbedding(BaseEmbedding):
+    """
+    通过 EmbeddingEngine 计算向量的 Embedding，可直接替代原模型用于构建索引和检索
+    """
+
+    _engine: EmbeddingEngine = PrivateAttr()
+
+    def __init__(self, engine: EmbeddingEngine, **kwargs: Any):
+        super().__init__(model_name=engine.embed_model.model_name, embed_batch_size=engine.max_batch_size,
+                         **kwargs)
+        self._engine = engine
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BatchedEmbedding"
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._engine.embed([query], QUERY)[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await asyncio.wrap_future(self._engine.submit([query], QUERY)))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._engine.embed([text], TEXT)[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await asyncio.wrap_future(self._engine.submit([text], TEXT)))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._engine.embed(texts, TEXT)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self._engine.submit(texts, TEXT))
@@ -1,3 +1,10 @@
 from concurrent.futures import ThreadPoolExecutor
+from core.config import RAG_INDEX_WORKERS, RAG_RETRIEVAL_WORKERS
 
-executor = ThreadPoolExecutor(max_workers=10)
\ No newline at end of file
+executor = ThreadPoolExecutor(max_workers=10)
+
+# 文档索引任务专用线程池，限制同时构建索引的数量
+index_executor = ThreadPoolExecutor(max_workers=RAG_INDEX_WORKERS)
+
+# 多文档检索线程池
+retrieval_executor = ThreadPoolExecutor(max_workers=RAG_RETRIEVAL_WORKERS)
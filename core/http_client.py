@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Coroutine
+
+import httpx
+
+from core.config import DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT, HTTP_MAX_CONNECTIONS
+
+
+class AsyncHttpClient:
+    """
+    在后台线程的事件循环中运行共享的 httpx.AsyncClient，同步代码和其他事件循环都可以复用同一个连接池。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: httpx.AsyncClient | None = None
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="http-client-loop", daemon=True).start()
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(DOWNLOAD_READ_TIMEOUT, connect=DOWNLOAD_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                    max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+                follow_redirects=True
+            )
+            self._loop = loop
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        self._ensure_started()
+        return self._client
+
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        在客户端所在的事件循环中执行协程
+
+        :param coro: 使用 client 的协程
+        :return: concurrent.futures.Future
+        """
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def run(self, coro: Coroutine):
+        """
+        在其他事件循环中等待协程在客户端事件循环中执行完成
+        """
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def close(self):
+        if self._loop is None:
+            return
+        self.submit(self._client.aclose()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+http_client = AsyncHttpClient()
@@ -0,0 +1,65 @@
+import asyncio
+from typing import List, Optional
+
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+
+from core.bm25_index import Bm25Index
+
+
+def reciprocal_rank_fusion(rankings: list[list[NodeWithScore]], top_k: int, rrf_k: int = 60) -> list[NodeWithScore]:
+    """
+    倒数排名融合，分数为节点在各路排名中的 sum(1 / (rrf_k + 排名))
+
+    :param rankings: 多路检索结果，每一路按相关度从高到低排列
+    """
+    scores: dict[str, float] = {}
+    nodes = {}
+    for ranking in rankings:
+        for rank, node in enumerate(ranking):
+            scores[node.node.node_id] = scores.get(node.node.node_id, 0) + 1 / (rrf_k + rank + 1)
+            nodes.setdefault(node.node.node_id, node.node)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    向量检索与 BM25 关键词检索的混合检索，用倒数排名融合(RRF)合并两路结果。
+    只在关键词检索中出现的节点从 docstore 读取。
+    """
+
+    def __init__(self, vector_retriever: BaseRetriever, keyword_index: Bm25Index, docstore: BaseDocumentStore,
+                 similarity_top_k: int, rrf_k: int = 60, callback_manager: Optional[CallbackManager] = None):
+        self._vector_retriever = vector_retriever
+        self._keyword_index = keyword_index
+        self._docstore = docstore
+        self._similarity_top_k = similarity_top_k
+        self._rrf_k = rrf_k
+        super().__init__(callback_manager=callback_manager)
+
+    def retrieve_rankings(self, query_bundle: QueryBundle) -> tuple[List[NodeWithScore], List[NodeWithScore]]:
+        """
+        分别返回向量检索和关键词检索的结果，分数为余弦相似度和 BM25 分数，
+        用于跨多个索引合并排名后再做一次融合
+        """
+        vector_nodes = self._vector_retriever.retrieve(query_bundle)
+        keyword_results = self._keyword_index.search(query_bundle.query_str, self._similarity_top_k)
+        nodes = {node.node.node_id: node.node for node in vector_nodes}
+        missing = [node_id for node_id, _ in keyword_results if node_id not in nodes]
+        if missing:
+            for node in self._docstore.get_nodes(missing):
+                nodes[node.node_id] = node
+        keyword_nodes = [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in keyword_results]
+        return vector_nodes, keyword_nodes
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return reciprocal_rank_fusion(list(self.retrieve_rankings(query_bundle)), self._similarity_top_k,
+                                      self._rrf_k)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # 向量检索、BM25 和读取 docstore 都是同步计算，在线程中执行
+        rankings = await asyncio.to_thread(self.retrieve_rankings, query_bundle)
+        return reciprocal_rank_fusion(list(rankings), self._similarity_top_k, self._rrf_k)
@@ -0,0 +1,135 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+from core.config import INDEX_CACHE_MAX_BYTES
+from core.logger import get_logger
+from core.numpy_vector_store import VECTOR_FILE_NAME, QUANTIZED_VECTOR_FILE_NAME
+from core.bm25_index import BM25_FILE_NAME
+
+
+def get_dir_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            # 有量化向量时 float32 向量只在精排时按行读取，不计入常驻内存
+            if VECTOR_FILE_NAME == file and QUANTIZED_VECTOR_FILE_NAME in files:
+                continue
+            # BM25 索引单独缓存
+            if BM25_FILE_NAME == file:
+                continue
+            size += os.path.getsize(os.path.join(root, file))
+    return size
+
+
+def index_generation(path: str) -> tuple[int, int] | None:
+    """
+    索引在磁盘上的版本。重建索引时整个目录被替换，inode 和修改时间都会变化，
+    多个 worker 进程据此判断自己缓存的索引是否已经过期
+
+    :return: (inode, 修改时间)，不存在时为 None
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class IndexCache:
+    """
+    已加载向量索引的 LRU 缓存，以持久化目录为 key，按索引在磁盘上的大小计算内存预算。
+    命中时检查索引在磁盘上的版本，其他进程重建了索引时重新加载。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[Any, int, tuple[int, int] | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: dict[str, threading.Lock] = {}
+        self.logger = get_logger()
+
+    def _get_load_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(key, threading.Lock())
+
+    def _lookup(self, key: str):
+        generation = index_generation(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] != generation:
+                self.current_bytes -= self._entries.pop(key)[1]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get(self, persist_dir: str, loader: Callable[[], Any]):
+        """
+        获取索引，未命中时调用 loader 加载并放入缓存
+
+        :param persist_dir: 索引持久化目录，也可以是目录中单独缓存的索引文件
+        :param loader: 加载索引的函数
+        """
+        key = os.path.abspath(persist_dir)
+        index = self._lookup(key)
+        if index is not None:
+            return index
+        # 同一个索引只加载一次，其余请求等待加载完成
+        with self._get_load_lock(key):
+            index = self._lookup(key)
+            if index is not None:
+                return index
+            # 加载前读取版本，加载过程中索引被替换时下次访问会重新加载
+            generation = index_generation(key)
+            index = loader()
+            size = get_dir_size(key)
+            with self._lock:
+                self.misses += 1
+                if size <= self.max_bytes:
+                    if key in self._entries:
+                        self.current_bytes -= self._entries.pop(key)[1]
+                    self._entries[key] = (index, size, generation)
+                    self.current_bytes += size
+                    self._evict()
+        self.logger.info(f"Index cache miss: {key}, size: {size}, stats: {self.stats()}")
+        return index
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            key, (_, size, _) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+            self.logger.info(f"Index cache evict: {key}")
+
+    def invalidate(self, persist_dir: str):
+        """
+        移除目录及目录中单独缓存的索引文件。只作用于当前进程，其他进程在访问时按版本判断
+        """
+        key = os.path.abspath(persist_dir)
+        with self._lock:
+            for entry_key in [entry_key for entry_key in self._entries
+                              if entry_key == key or entry_key.startswith(key + os.sep)]:
+                self.current_bytes -= self._entries.pop(entry_key)[1]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "bytes": self.current_bytes,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+index_cache = IndexCache(INDEX_CACHE_MAX_BYTES)
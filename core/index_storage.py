@@ -0,0 +1,87 @@
+import os
+import shutil
+import uuid
+
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from core.config import VECTOR_STORE_FORMAT, DOCSTORE_FORMAT
+from core.numpy_vector_store import NumpyVectorStore
+from core.compact_docstore import CompactDocumentStore
+from core.sqlite_storage import SqliteKVStore, SqliteDocumentStore, SqliteIndexStore
+from core.bm25_index import Bm25Index, BM25_FILE_NAME
+
+
+def new_storage_context() -> StorageContext:
+    """
+    创建用于构建新索引的 StorageContext，向量存储格式由 VECTOR_STORE_FORMAT 决定，docstore 格式由 DOCSTORE_FORMAT 决定
+    """
+    kwargs = {}
+    if "npy" == VECTOR_STORE_FORMAT:
+        kwargs["vector_store"] = NumpyVectorStore()
+    if "compact" == DOCSTORE_FORMAT:
+        kwargs["docstore"] = CompactDocumentStore()
+    elif "sqlite" == DOCSTORE_FORMAT:
+        kvstore = SqliteKVStore()
+        kwargs["docstore"] = SqliteDocumentStore(kvstore)
+        kwargs["index_store"] = SqliteIndexStore(kvstore)
+    return StorageContext.from_defaults(**kwargs)
+
+
+def load_storage_context(persist_dir: str) -> StorageContext:
+    """
+    根据持久化目录中的文件自动识别向量存储和 docstore 格式
+    """
+    kwargs = {}
+    if NumpyVectorStore.exists(persist_dir):
+        kwargs["vector_store"] = NumpyVectorStore.from_persist_dir(persist_dir)
+    if CompactDocumentStore.exists(persist_dir):
+        kwargs["docstore"] = CompactDocumentStore.from_persist_dir(persist_dir)
+    elif SqliteKVStore.exists(persist_dir):
+        # 节点在检索后按 id 从 SQLite 读取，不需要整体加载 docstore
+        kvstore = SqliteKVStore.from_persist_dir(persist_dir)
+        kwargs["docstore"] = SqliteDocumentStore(kvstore)
+        kwargs["index_store"] = SqliteIndexStore(kvstore)
+    return StorageContext.from_defaults(persist_dir=persist_dir, **kwargs)
+
+
+def load_index(persist_dir: str, embed_model):
+    return load_index_from_storage(load_storage_context(persist_dir), embed_model=embed_model)
+
+
+def build_keyword_index(nodes: list[BaseNode]) -> Bm25Index:
+    """
+    使用与计算向量时相同的文本构建 BM25 索引
+    """
+    return Bm25Index.build([node.node_id for node in nodes],
+                           [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes])
+
+
+def persist_index(index, persist_dir: str, overwrite: bool = False, keyword_index: Bm25Index | None = None) -> bool:
+    """
+    先持久化到临时目录再重命名，避免并发构建同一个索引时互相覆盖写了一半的文件
+
+    :param index: 需要持久化的索引
+    :param persist_dir: 持久化目录
+    :param overwrite: 目录已存在时是否替换
+    :param keyword_index: 与索引一起持久化的 BM25 索引
+    :return: 是否写入了 persist_dir
+    """
+    tmp_dir = f"{persist_dir}.{uuid.uuid4()}.tmp"
+    index.storage_context.persist(persist_dir=tmp_dir)
+    if keyword_index is not None:
+        keyword_index.save(os.path.join(tmp_dir, BM25_FILE_NAME))
+    if not overwrite:
+        try:
+            os.rename(tmp_dir, persist_dir)
+            return True
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+    # 已加载的索引通过内存映射引用旧文件，删除目录不影响其继续使用
+    old_dir = f"{persist_dir}.{uuid.uuid4()}.old"
+    if os.path.exists(persist_dir):
+        os.rename(persist_dir, old_dir)
+    os.rename(tmp_dir, persist_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return True
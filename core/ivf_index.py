@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+
+IVF_CENTROIDS_FILE_NAME = "ivf_centroids.npy"
+IVF_OFFSETS_FILE_NAME = "ivf_offsets.npy"
+IVF_ROWS_FILE_NAME = "ivf_rows.npy"
+# 分块计算向量与聚类中心的相似度，限制临时矩阵的大小
+ASSIGN_CHUNK_SIZE = 65536
+# 每个聚类中心最多使用的训练样本数
+TRAIN_SAMPLES_PER_LIST = 256
+
+
+def assign(embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), ASSIGN_CHUNK_SIZE):
+        chunk = np.asarray(embeddings[start:start + ASSIGN_CHUNK_SIZE], dtype=np.float32)
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(embeddings: np.ndarray, n_lists: int, iterations: int, seed: int = 0) -> np.ndarray:
+    """
+    对归一化后的向量做球面 k-means，返回归一化的聚类中心
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(embeddings), n_lists * TRAIN_SAMPLES_PER_LIST)
+    sample = np.asarray(embeddings[np.sort(rng.choice(len(embeddings), sample_size, replace=False))],
+                        dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # 空的聚类重新取一个随机样本作为中心
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        norms[empty] = 1
+        centroids = sums / norms
+    return centroids
+
+
+class IvfIndex:
+    """
+    倒排文件(IVF)近似检索索引。向量按最近的聚类中心分桶，查询时只扫描与查询最相近的 nprobe 个桶，
+    nprobe 越大召回率越高、耗时越长。桶内的行号以 CSR 形式保存：rows[offsets[i]:offsets[i + 1]] 是第 i 个桶。
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, n_lists: int | None = None, iterations: int = 10) -> "IvfIndex":
+        """
+        :param embeddings: 归一化后的向量矩阵
+        :param n_lists: 桶的数量，默认取向量数的平方根
+        :param iterations: k-means 迭代次数
+        """
+        n_lists = min(n_lists or max(1, int(np.sqrt(len(embeddings)))), len(embeddings))
+        centroids = spherical_kmeans(embeddings, n_lists, iterations)
+        labels = assign(embeddings, centroids)
+        rows = np.argsort(labels, kind="stable")
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(labels, minlength=n_lists))
+        return cls(centroids.astype(np.float32), offsets, rows.astype(np.int64))
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, IVF_CENTROIDS_FILE_NAME))
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "IvfIndex":
+        return cls(np.load(os.path.join(persist_dir, IVF_CENTROIDS_FILE_NAME)),
+                   np.load(os.path.join(persist_dir, IVF_OFFSETS_FILE_NAME)),
+                   np.load(os.path.join(persist_dir, IVF_ROWS_FILE_NAME), mmap_mode="r"))
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """
+        需要持久化的文件名与数组
+        """
+        return {IVF_CENTROIDS_FILE_NAME: self.centroids, IVF_OFFSETS_FILE_NAME: self.offsets,
+                IVF_ROWS_FILE_NAME: np.asarray(self.rows)}
+
+    def candidates(self, query_embedding: np.ndarray, nprobe: int) -> np.ndarray:
+        """
+        返回与查询最相近的 nprobe 个桶中的全部行号
+        """
+        nprobe = min(nprobe, self.n_lists)
+        scores = self.centroids @ query_embedding
+        lists = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in lists])
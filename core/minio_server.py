@@ -16,6 +16,8 @@ class MinioServer:
         self.client.fput_object(self.bucket, destination, source_file_path)
         # self.log.info(source_file_path, "successfully uploaded as object",
         #     f"{self.base_path}/{destination_file_path}", "to bucket", self.bucket,)
-        url = self.client.presigned_get_object(self.bucket, destination)
-        return url
+        return self.presigned_url(destination_file_path)
+
+    def presigned_url(self, destination_file_path: str) -> str:
+        return self.client.presigned_get_object(self.bucket, f"{self.base_path}/{destination_file_path}")
 
@@ -0,0 +1,91 @@
+import threading
+
+from llama_index.llms.openai import OpenAI
+from llama_index.llms.ollama import Ollama
+from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+from core.config import EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT_MS
+from core.embedding_engine import EmbeddingEngine, BatchedEmbedding
+from core.logger import get_logger
+
+OLLAMA_MODELS = ("mistral", "llama3", "qwen2", "gemma")
+HUGGINGFACE_EMBEDDING_MODELS = ("BAAI/bge-small-zh-v1.5", "BAAI/bge-small-en-v1.5")
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+class ModelRegistry:
+    """
+    进程内共享的模型注册表，按模型名称缓存 LLM 与 Embedding 实例，避免每个请求重复加载模型。
+    """
+
+    def __init__(self):
+        self._llms = {}
+        self._embed_models = {}
+        self._llm_lock = threading.Lock()
+        self._embed_lock = threading.Lock()
+        self.logger = get_logger()
+
+    def _create_llm(self, model: str):
+        if model in OLLAMA_MODELS:
+            return Ollama(model=model, request_timeout=300.0)
+        return OpenAI(model=model)
+
+    def _create_embed_model(self, model: str):
+        if model in HUGGINGFACE_EMBEDDING_MODELS:
+            embed_model = HuggingFaceEmbedding(model_name=model)
+        else:
+            embed_model = OpenAIEmbedding(model_name=model)
+        # 所有调用方共用同一个批处理引擎
+        return BatchedEmbedding(EmbeddingEngine(embed_model, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT_MS))
+
+    def get_llm(self, model: str):
+        llm = self._llms.get(model)
+        if llm is not None:
+            return llm
+        with self._llm_lock:
+            llm = self._llms.get(model)
+            if llm is None:
+                self.logger.info(f"Loading llm: {model}")
+                llm = self._create_llm(model)
+                self._llms[model] = llm
+        return llm
+
+    def get_embed_model(self, model: str | None):
+        model = model or DEFAULT_EMBEDDING_MODEL
+        embed_model = self._embed_models.get(model)
+        if embed_model is not None:
+            return embed_model
+        with self._embed_lock:
+            embed_model = self._embed_models.get(model)
+            if embed_model is None:
+                self.logger.info(f"Loading embedding model: {model}")
+                embed_model = self._create_embed_model(model)
+                self._embed_models[model] = embed_model
+        return embed_model
+
+    def warmup(self, llm_models: list[str], embed_models: list[str], warmup_calls: bool = False):
+        """
+        启动时预加载模型
+
+        :param llm_models: 需要预加载的 LLM 名称
+        :param embed_models: 需要预加载的 Embedding 模型名称
+        :param warmup_calls: 是否对每个模型执行一次预热调用
+        """
+        for model in filter(None, dict.fromkeys(embed_models)):
+            embed_model = self.get_embed_model(model)
+            if warmup_calls:
+                try:
+                    embed_model.get_text_embedding("warmup")
+                except Exception:
+                    self.logger.exception(f"Embedding warmup failed: {model}")
+        for model in filter(None, dict.fromkeys(llm_models)):
+            llm = self.get_llm(model)
+            if warmup_calls:
+                try:
+                    llm.complete("ping")
+                except Exception:
+                    self.logger.exception(f"LLM warmup failed: {model}")
+
+
+model_registry = ModelRegistry()
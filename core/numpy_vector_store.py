@@ -0,0 +1,257 @@
+import os
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+from core.config import ANN_NPROBE, VECTOR_QUANTIZATION, VECTOR_RESCORE_FACTOR
+from core.ivf_index import IvfIndex
+
+VECTOR_FILE_NAME = "vector_store.npy"
+NODE_ID_FILE_NAME = "vector_store_node_ids.npy"
+REF_DOC_ID_FILE_NAME = "vector_store_ref_doc_ids.npy"
+QUANTIZED_VECTOR_FILE_NAME = "vector_store_quantized.npy"
+SCALE_FILE_NAME = "vector_store_scales.npy"
+VECTOR_QUANTIZATIONS = ("none", "float16", "int8")
+# 分块反量化计算粗排分数，限制临时矩阵的大小
+COARSE_CHUNK_SIZE = 65536
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+def quantize(embeddings: np.ndarray, quantization: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    量化向量矩阵
+
+    :param quantization: float16 或 int8，int8 使用每个向量各自的缩放系数
+    :return: (量化后的矩阵, 缩放系数)
+    """
+    if "float16" == quantization:
+        return embeddings.astype(np.float16), None
+    if "int8" == quantization:
+        scales = np.abs(embeddings).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(embeddings / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unsupported vector quantization: {quantization}")
+
+
+def save_npy(path: str, array: np.ndarray):
+    # 先写临时文件再替换，避免读取到写了一半的文件
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    以 float32 的 .npy 矩阵持久化向量，加载时使用内存映射，检索时用一次矩阵向量乘法计算余弦相似度。
+    向量在写入时已归一化，文本由 docstore 保存。构建了 IVF 索引时只对候选桶内的向量计算相似度。
+    """
+
+    stores_text: bool = False
+    nprobe: int = ANN_NPROBE
+    quantization: str = VECTOR_QUANTIZATION
+    rescore_factor: int = VECTOR_RESCORE_FACTOR
+
+    _embeddings: np.ndarray = PrivateAttr()
+    _node_ids: np.ndarray = PrivateAttr()
+    _ref_doc_ids: np.ndarray = PrivateAttr()
+    _pending_embeddings: list = PrivateAttr()
+    _pending_node_ids: list = PrivateAttr()
+    _pending_ref_doc_ids: list = PrivateAttr()
+    _node_id_positions: Optional[dict] = PrivateAttr()
+    _ivf: Optional[IvfIndex] = PrivateAttr()
+    _quantized: Optional[np.ndarray] = PrivateAttr()
+    _scales: Optional[np.ndarray] = PrivateAttr()
+
+    def __init__(self, embeddings: Optional[np.ndarray] = None, node_ids: Optional[np.ndarray] = None,
+                 ref_doc_ids: Optional[np.ndarray] = None, ivf: Optional[IvfIndex] = None,
+                 quantized: Optional[np.ndarray] = None, scales: Optional[np.ndarray] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        if self.quantization not in VECTOR_QUANTIZATIONS:
+            raise ValueError(f"Unsupported vector quantization: {self.quantization}")
+        self._embeddings = embeddings if embeddings is not None else np.zeros((0, 0), dtype=np.float32)
+        self._node_ids = node_ids if node_ids is not None else np.array([], dtype=str)
+        self._ref_doc_ids = ref_doc_ids if ref_doc_ids is not None else np.array([], dtype=str)
+        self._pending_embeddings = []
+        self._pending_node_ids = []
+        self._pending_ref_doc_ids = []
+        self._node_id_positions = None
+        self._ivf = ivf
+        self._quantized = quantized
+        self._scales = scales
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, VECTOR_FILE_NAME))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "NumpyVectorStore":
+        embeddings = np.load(os.path.join(persist_dir, VECTOR_FILE_NAME), mmap_mode="r")
+        node_ids = np.load(os.path.join(persist_dir, NODE_ID_FILE_NAME), mmap_mode="r")
+        ref_doc_ids = np.load(os.path.join(persist_dir, REF_DOC_ID_FILE_NAME), mmap_mode="r")
+        ivf = IvfIndex.load(persist_dir) if IvfIndex.exists(persist_dir) else None
+        quantized = None
+        scales = None
+        if os.path.exists(os.path.join(persist_dir, QUANTIZED_VECTOR_FILE_NAME)):
+            # 内存映射的量化矩阵由同一台机器上的多个 worker 进程共享页缓存
+            quantized = np.load(os.path.join(persist_dir, QUANTIZED_VECTOR_FILE_NAME), mmap_mode="r")
+            if os.path.exists(os.path.join(persist_dir, SCALE_FILE_NAME)):
+                scales = np.load(os.path.join(persist_dir, SCALE_FILE_NAME), mmap_mode="r")
+        return cls(embeddings=embeddings, node_ids=node_ids, ref_doc_ids=ref_doc_ids, ivf=ivf, quantized=quantized,
+                   scales=scales)
+
+    @classmethod
+    def from_embedding_dict(cls, embedding_dict: dict, ref_doc_id_dict: dict) -> "NumpyVectorStore":
+        node_ids = list(embedding_dict.keys())
+        if not node_ids:
+            return cls()
+        embeddings = normalize(np.asarray([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32))
+        ref_doc_ids = [ref_doc_id_dict.get(node_id) or "" for node_id in node_ids]
+        return cls(embeddings=embeddings, node_ids=np.array(node_ids), ref_doc_ids=np.array(ref_doc_ids))
+
+    def _consolidate(self):
+        if not self._pending_node_ids:
+            return
+        pending = normalize(np.asarray(self._pending_embeddings, dtype=np.float32))
+        if len(self._node_ids) == 0:
+            self._embeddings = pending
+        else:
+            self._embeddings = np.concatenate([self._embeddings, pending])
+        self._node_ids = np.concatenate([self._node_ids, np.array(self._pending_node_ids)])
+        self._ref_doc_ids = np.concatenate([self._ref_doc_ids, np.array(self._pending_ref_doc_ids)])
+        self._pending_embeddings = []
+        self._pending_node_ids = []
+        self._pending_ref_doc_ids = []
+        self._node_id_positions = None
+        self._ivf = None
+        self._quantized = None
+        self._scales = None
+
+    def build_ann(self, n_lists: Optional[int] = None):
+        """
+        构建 IVF 近似检索索引，之后新增或删除向量会使其失效
+        """
+        self._consolidate()
+        if len(self._node_ids) > 0:
+            self._ivf = IvfIndex.build(self._embeddings, n_lists=n_lists)
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        for node in nodes:
+            self._pending_embeddings.append(node.get_embedding())
+            self._pending_node_ids.append(node.node_id)
+            self._pending_ref_doc_ids.append(node.ref_doc_id or "")
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._consolidate()
+        keep = self._ref_doc_ids != ref_doc_id
+        self._embeddings = np.asarray(self._embeddings[keep])
+        self._node_ids = np.asarray(self._node_ids[keep])
+        self._ref_doc_ids = np.asarray(self._ref_doc_ids[keep])
+        self._node_id_positions = None
+        self._ivf = None
+        self._quantized = None
+        self._scales = None
+
+    def _positions_of(self, node_ids: List[str]) -> np.ndarray:
+        if self._node_id_positions is None:
+            self._node_id_positions = {str(node_id): i for i, node_id in enumerate(self._node_ids)}
+        return np.array([self._node_id_positions[node_id] for node_id in node_ids
+                         if node_id in self._node_id_positions], dtype=np.int64)
+
+    def _coarse_candidates(self, positions: Optional[np.ndarray], query_embedding: np.ndarray,
+                           count: int) -> Optional[np.ndarray]:
+        """
+        在量化矩阵上计算近似分数，返回分数最高的 count 个行号，候选本来就不多于 count 时原样返回
+        """
+        total = len(self._node_ids) if positions is None else len(positions)
+        if total <= count:
+            return positions
+        coarse_scores = np.empty(total, dtype=np.float32)
+        for start in range(0, total, COARSE_CHUNK_SIZE):
+            rows = slice(start, start + COARSE_CHUNK_SIZE) if positions is None \
+                else positions[start:start + COARSE_CHUNK_SIZE]
+            chunk_scores = self._quantized[rows].astype(np.float32) @ query_embedding
+            if self._scales is not None:
+                chunk_scores *= self._scales[rows]
+            coarse_scores[start:start + len(chunk_scores)] = chunk_scores
+        top = np.argpartition(-coarse_scores, count - 1)[:count]
+        # 按行号顺序读取 float32 向量，减少内存映射的随机访问
+        return np.sort(top if positions is None else positions[top])
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("Metadata filters are not supported by NumpyVectorStore")
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Query mode {query.mode} is not supported by NumpyVectorStore")
+        self._consolidate()
+        if len(self._node_ids) == 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        query_embedding = normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        if query.node_ids:
+            positions = self._positions_of(query.node_ids)
+            scores = self._embeddings[positions] @ query_embedding
+        elif self._ivf is not None:
+            positions = np.sort(self._ivf.candidates(query_embedding, kwargs.get("nprobe", self.nprobe)))
+            if len(positions) < query.similarity_top_k:
+                # 候选数量不足时退回精确检索
+                positions = None
+        else:
+            positions = None
+        if self._quantized is not None:
+            positions = self._coarse_candidates(positions, query_embedding,
+                                                query.similarity_top_k * self.rescore_factor)
+        if positions is not None:
+            scores = self._embeddings[positions] @ query_embedding
+        else:
+            scores = self._embeddings @ query_embedding
+
+        top_k = min(query.similarity_top_k, len(scores))
+        if top_k <= 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        if positions is not None:
+            ids = self._node_ids[positions[top]]
+        else:
+            ids = self._node_ids[top]
+        return VectorStoreQueryResult(similarities=scores[top].tolist(), ids=[str(node_id) for node_id in ids])
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        # StorageContext 传入的是 json 文件路径，这里只使用其所在目录
+        persist_dir = os.path.dirname(persist_path)
+        os.makedirs(persist_dir, exist_ok=True)
+        self._consolidate()
+        save_npy(os.path.join(persist_dir, VECTOR_FILE_NAME), np.ascontiguousarray(self._embeddings, dtype=np.float32))
+        save_npy(os.path.join(persist_dir, NODE_ID_FILE_NAME), np.asarray(self._node_ids, dtype=str))
+        save_npy(os.path.join(persist_dir, REF_DOC_ID_FILE_NAME), np.asarray(self._ref_doc_ids, dtype=str))
+        if self._ivf is not None:
+            for file_name, array in self._ivf.arrays().items():
+                save_npy(os.path.join(persist_dir, file_name), array)
+        if "none" != self.quantization and len(self._node_ids) > 0:
+            quantized, scales = quantize(np.asarray(self._embeddings, dtype=np.float32), self.quantization)
+            save_npy(os.path.join(persist_dir, QUANTIZED_VECTOR_FILE_NAME), quantized)
+            if scales is not None:
+                save_npy(os.path.join(persist_dir, SCALE_FILE_NAME), scales)
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.callbacks import CBEventType, EventPayload
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+
+# 检索结果中每个节点推送的最大文本长度
+NODE_PREVIEW_LENGTH = 200
+
+
+class QueueCallbackHandler(BaseCallbackHandler):
+    """
+    把 Agent 的工具调用和检索事件写入 asyncio.Queue，供 SSE 接口推送。
+    回调可能在其他线程中触发，因此通过 call_soon_threadsafe 写入队列。
+    """
+
+    def __init__(self, task_id: str, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self.task_id = task_id
+        self.queue = queue
+        self.loop = loop
+
+    def _put(self, event: str, data: dict):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (event, data))
+
+    def on_event_start(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None,
+                       event_id: str = "", parent_id: str = "", **kwargs: Any) -> str:
+        if event_type == CBEventType.FUNCTION_CALL and payload is not None:
+            tool = payload.get(EventPayload.TOOL)
+            self._put("tool_call", {
+                "id": self.task_id,
+                "tool": tool.name if tool is not None else "",
+                "input": str(payload.get(EventPayload.FUNCTION_CALL, ""))
+            })
+        return event_id
+
+    def on_event_end(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None,
+                     event_id: str = "", **kwargs: Any) -> None:
+        if event_type == CBEventType.RETRIEVE and payload is not None:
+            self._put("retrieval", {
+                "id": self.task_id,
+                "nodes": [{
+                    "id": node.node.node_id,
+                    "score": node.score,
+                    "text": node.node.get_content()[:NODE_PREVIEW_LENGTH]
+                } for node in payload.get(EventPayload.NODES, [])]
+            })
+        elif event_type == CBEventType.FUNCTION_CALL and payload is not None:
+            self._put("tool_output", {
+                "id": self.task_id,
+                "output": str(payload.get(EventPayload.FUNCTION_OUTPUT, ""))
+            })
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(self, trace_id: Optional[str] = None, trace_map: Optional[Dict[str, List[str]]] = None) -> None:
+        pass
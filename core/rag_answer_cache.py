@@ -0,0 +1,116 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from constants.redis_constants import RAG_INDEX_GENERATION, RAG_ANSWER_CACHE, RAG_ANSWER_SEMANTIC_CACHE
+from core.config import RAG_LLM_MODEL, BASE_PROMPT, RAG_ANSWER_CACHE_TTL, RAG_ANSWER_CACHE_SEMANTIC, \
+    RAG_ANSWER_CACHE_SIMILARITY, RAG_ANSWER_CACHE_SEMANTIC_MAX_ENTRIES, RAG_EMBEDDING_MODEL
+from core.model_registry import model_registry
+from core.redis import get_redis_pool
+from core.redis_server import RedisServer
+
+BASE_PROMPT_VERSION = hashlib.sha256((BASE_PROMPT or "").encode("utf-8")).hexdigest()[:12]
+# 进程内保留的问题向量数量
+PROMPT_EMBEDDING_MAX_ENTRIES = 1000
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split()).lower()
+
+
+class RagAnswerCache:
+    """
+    RAG 回答缓存，key 为 (文件哈希, 查询模式, 规范化后的问题, LLM 模型, BASE_PROMPT 版本)。
+    可选的语义缓存按问题向量的余弦相似度匹配相近的问题，每个文件最多保留 RAG_ANSWER_CACHE_SEMANTIC_MAX_ENTRIES
+    个问题，超出时淘汰最早加入的。索引重建时递增文件的索引版本号，旧的缓存不再命中并随 TTL 过期。
+    """
+
+    def __init__(self, redis_server: RedisServer, embed_model_name: str | None):
+        self.redis_server = redis_server
+        self.embed_model_name = embed_model_name
+        self._prompt_embeddings: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return RAG_ANSWER_CACHE_TTL > 0
+
+    def _generation(self, file_hash: str) -> int:
+        return int(self.redis_server.redis.get(f"{RAG_INDEX_GENERATION}:{file_hash}") or 0)
+
+    def _scope(self, file_hash: str, mode: str) -> str:
+        return f"{file_hash}:{self._generation(file_hash)}:{mode}:{RAG_LLM_MODEL}:{BASE_PROMPT_VERSION}"
+
+    def _prompt_embedding(self, prompt: str) -> np.ndarray:
+        with self._lock:
+            embedding = self._prompt_embeddings.get(prompt)
+            if embedding is not None:
+                self._prompt_embeddings.move_to_end(prompt)
+                return embedding
+        embed_model = model_registry.get_embed_model(self.embed_model_name)
+        embedding = np.asarray(embed_model.get_query_embedding(prompt), dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) or 1)
+        with self._lock:
+            self._prompt_embeddings[prompt] = embedding
+            while len(self._prompt_embeddings) > PROMPT_EMBEDDING_MAX_ENTRIES:
+                self._prompt_embeddings.popitem(last=False)
+        return embedding
+
+    def get(self, file_hash: str, prompt: str, mode: str) -> str | None:
+        if not self.enabled:
+            return None
+        scope = self._scope(file_hash, mode)
+        prompt = normalize_prompt(prompt)
+        answer_key = hashlib.sha256(f"{scope}:{prompt}".encode("utf-8")).hexdigest()
+        answer = self.redis_server.get(f"{RAG_ANSWER_CACHE}:{answer_key}")
+        if answer is not None or not RAG_ANSWER_CACHE_SEMANTIC:
+            return answer
+
+        entries = self.redis_server.redis.hgetall(f"{RAG_ANSWER_SEMANTIC_CACHE}:{scope}")
+        if not entries:
+            return None
+        keys = list(entries.keys())
+        embeddings = np.asarray([json.loads(entries[key]) for key in keys], dtype=np.float32)
+        similarities = embeddings @ self._prompt_embedding(prompt)
+        best = int(np.argmax(similarities))
+        if similarities[best] < RAG_ANSWER_CACHE_SIMILARITY:
+            return None
+        return self.redis_server.get(f"{RAG_ANSWER_CACHE}:{keys[best]}")
+
+    def put(self, file_hash: str, prompt: str, mode: str, answer: str):
+        if not self.enabled:
+            return
+        scope = self._scope(file_hash, mode)
+        prompt = normalize_prompt(prompt)
+        answer_key = hashlib.sha256(f"{scope}:{prompt}".encode("utf-8")).hexdigest()
+        self.redis_server.set_ex(f"{RAG_ANSWER_CACHE}:{answer_key}", answer, RAG_ANSWER_CACHE_TTL)
+        if not RAG_ANSWER_CACHE_SEMANTIC:
+            return
+        semantic_key = f"{RAG_ANSWER_SEMANTIC_CACHE}:{scope}"
+        # 有序集合按加入时间记录问题，超出数量时淘汰最早的
+        order_key = f"{semantic_key}:order"
+        embedding = json.dumps(self._prompt_embedding(prompt).tolist())
+        pipeline = self.redis_server.redis.pipeline()
+        pipeline.hset(semantic_key, answer_key, embedding)
+        pipeline.zadd(order_key, {answer_key: time.time()})
+        pipeline.zcard(order_key)
+        size = pipeline.execute()[-1]
+        if size > RAG_ANSWER_CACHE_SEMANTIC_MAX_ENTRIES:
+            evicted = [key for key, _ in self.redis_server.redis.zpopmin(
+                order_key, size - RAG_ANSWER_CACHE_SEMANTIC_MAX_ENTRIES)]
+            if evicted:
+                self.redis_server.redis.hdel(semantic_key, *evicted)
+        pipeline = self.redis_server.redis.pipeline()
+        pipeline.expire(semantic_key, RAG_ANSWER_CACHE_TTL)
+        pipeline.expire(order_key, RAG_ANSWER_CACHE_TTL)
+        pipeline.execute()
+
+    def invalidate(self, file_hash: str):
+        self.redis_server.redis.incr(f"{RAG_INDEX_GENERATION}:{file_hash}")
+
+
+rag_answer_cache = RagAnswerCache(RedisServer(get_redis_pool()), RAG_EMBEDDING_MODEL)
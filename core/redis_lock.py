@@ -0,0 +1,101 @@
+import threading
+import time
+from typing import Callable
+
+from core.logger import get_logger
+from core.redis_server import RedisServer
+
+
+class RedisLockLease:
+    """
+    持有 Redis 锁期间由后台线程定时续期。锁的过期时间较短，持有者所在进程退出后锁很快过期，
+    等待者可以接手。退出时只删除仍属于自己的锁。
+    """
+
+    def __init__(self, redis_server: RedisServer, key: str, value, ex: int):
+        self.redis_server = redis_server
+        self.key = key
+        self.value = value
+        self.ex = ex
+        self.logger = get_logger()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._renew, name=f"lock-lease-{key}", daemon=True)
+
+    def _renew(self):
+        while not self._stopped.wait(self.ex / 3):
+            try:
+                if not self.redis_server.expire_if_equal(self.key, self.value, self.ex):
+                    self.logger.warning(f"Lock lost before release: {self.key}")
+                    return
+            except Exception:
+                self.logger.exception(f"Failed to renew lock: {self.key}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stopped.set()
+        self._thread.join()
+        self.redis_server.delete_if_equal(self.key, self.value)
+
+
+class RedisLockWatcher:
+    """
+    等待者在锁的持有者完成后由持有者通知。持有者所在进程退出时不会通知，
+    锁过期后等待者仍在等待集合中，此时将其移出集合并调用 on_expired 接手。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.logger = get_logger()
+        self._entries: list[tuple[RedisServer, str, str, str, Callable[[], None]]] = []
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def watch(self, redis_server: RedisServer, lock_key: str, followers_key: str, member: str,
+              on_expired: Callable[[], None]):
+        """
+        :param lock_key: 持有者的锁
+        :param followers_key: 等待集合
+        :param member: 等待者在集合中的值
+        :param on_expired: 锁过期且未被通知时调用
+        """
+        with self._lock:
+            self._entries.append((redis_server, lock_key, followers_key, member, on_expired))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="lock-watcher", daemon=True)
+                self._thread.start()
+
+    def _check(self, entry) -> bool:
+        """
+        :return: 是否不再需要检查
+        """
+        redis_server, lock_key, followers_key, member, on_expired = entry
+        if not redis_server.sismember(followers_key, member):
+            return True
+        if redis_server.get(lock_key) is not None:
+            return False
+        # 持有者正常结束时也可能先删除锁再通知，移出成功的一方负责处理，不会重复
+        if redis_server.srem(followers_key, member):
+            self.logger.warning(f"Lock expired without notifying: {lock_key}")
+            on_expired()
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                entries = list(self._entries)
+            done = []
+            for entry in entries:
+                try:
+                    if self._check(entry):
+                        done.append(entry)
+                except Exception:
+                    self.logger.exception(f"Failed to check lock: {entry[1]}")
+            with self._lock:
+                self._entries = [entry for entry in self._entries if entry not in done]
+
+
+redis_lock_watcher = RedisLockWatcher(5)
@@ -6,6 +6,20 @@ from time import sleep
 import json
 import time
 
+# 只有值相同时才续期或删除，避免操作已经被其他持有者重新获取的锁
+EXPIRE_IF_EQUAL_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+DELETE_IF_EQUAL_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 
 class RedisServer:
     READ_LOCK_PREFIX = "READ_LOCK:"
@@ -30,6 +44,31 @@ class RedisServer:
     def delete(self, key: str):
         self.redis.delete(key)
 
+    def set_nx_ex(self, key: str, data, ex: int) -> bool:
+        return bool(self.redis.set(key, json.dumps(data), nx=True, ex=ex))
+
+    def expire_if_equal(self, key: str, data, ex: int) -> bool:
+        return bool(self.redis.eval(EXPIRE_IF_EQUAL_SCRIPT, 1, key, json.dumps(data), ex))
+
+    def delete_if_equal(self, key: str, data) -> bool:
+        return bool(self.redis.eval(DELETE_IF_EQUAL_SCRIPT, 1, key, json.dumps(data)))
+
+    def sadd(self, key: str, value: str):
+        self.redis.sadd(key, value)
+
+    def srem(self, key: str, value: str) -> bool:
+        return bool(self.redis.srem(key, value))
+
+    def sismember(self, key: str, value: str) -> bool:
+        return bool(self.redis.sismember(key, value))
+
+    def pop_members(self, key: str) -> set:
+        pipeline = self.redis.pipeline()
+        pipeline.smembers(key)
+        pipeline.delete(key)
+        members, _ = pipeline.execute()
+        return members
+
     def read_lock(self, key: str):
         try:
             self.get_read_lock(key)
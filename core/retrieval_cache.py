@@ -0,0 +1,74 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from core.config import RETRIEVAL_CACHE_MAX_ENTRIES
+from core.embedding_cache import text_hash
+from core.index_cache import index_generation
+
+
+def vector_key(embedding: list[float]) -> str:
+    return hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+
+
+class RetrievalCache:
+    """
+    检索层的进程内 LRU 缓存，包含两张表：
+    (Embedding 模型, 问题文本) -> 问题向量；(索引目录, 问题向量, top k) -> 节点 id 与分数。
+    检索结果记录索引目录的版本，读取时版本不一致视为未命中，其他进程重建索引后不会返回旧结果。
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._embeddings: OrderedDict[tuple[str, str], list[float]] = OrderedDict()
+        self._results: OrderedDict[tuple[str, str, int], tuple[tuple[int, int] | None, list[tuple[str, float]]]] \
+            = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, entries: OrderedDict, key):
+        with self._lock:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+            return value
+
+    def _put(self, entries: OrderedDict, key, value):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def get_embedding(self, model: str, query: str) -> list[float] | None:
+        return self._get(self._embeddings, (model, text_hash(query)))
+
+    def put_embedding(self, model: str, query: str, embedding: list[float]):
+        self._put(self._embeddings, (model, text_hash(query)), embedding)
+
+    def get_result(self, persist_dir: str, embedding: list[float], top_k: int) -> list[tuple[str, float]] | None:
+        key = (os.path.abspath(persist_dir), vector_key(embedding), top_k)
+        value = self._get(self._results, key)
+        if value is None:
+            return None
+        generation, result = value
+        if generation != index_generation(key[0]):
+            with self._lock:
+                self._results.pop(key, None)
+            return None
+        return result
+
+    def put_result(self, persist_dir: str, embedding: list[float], top_k: int, result: list[tuple[str, float]]):
+        key = (os.path.abspath(persist_dir), vector_key(embedding), top_k)
+        self._put(self._results, key, (index_generation(key[0]), result))
+
+    def invalidate(self, persist_dir: str):
+        key = os.path.abspath(persist_dir)
+        with self._lock:
+            for result_key in [result_key for result_key in self._results if result_key[0] == key]:
+                del self._results[result_key]
+
+
+retrieval_cache = RetrievalCache(RETRIEVAL_CACHE_MAX_ENTRIES)
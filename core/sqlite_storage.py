@@ -0,0 +1,109 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import fsspec
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.index_store.keyval_index_store import KVIndexStore
+from llama_index.core.storage.kvstore.types import BaseKVStore, DEFAULT_COLLECTION, DEFAULT_BATCH_SIZE
+
+INDEX_SQLITE_FILE_NAME = "index.sqlite"
+
+
+class SqliteKVStore(BaseKVStore):
+    """
+    docstore 和 index store 共用的 SQLite KV 存储，每个索引一个文件，以 (collection, key) 为主键按需读取。
+    构建索引时使用内存数据库，所有写入在同一个事务中，persist 时提交并备份到索引目录。
+    """
+
+    def __init__(self, db_path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "collection TEXT NOT NULL, "
+            "key TEXT NOT NULL, "
+            "value TEXT NOT NULL, "
+            "PRIMARY KEY (collection, key))"
+        )
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, INDEX_SQLITE_FILE_NAME))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "SqliteKVStore":
+        return cls(os.path.join(persist_dir, INDEX_SQLITE_FILE_NAME))
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put_all([(key, val)], collection=collection)
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection=collection)
+
+    def put_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)",
+                [(collection, key, json.dumps(val, ensure_ascii=False)) for key, val in kv_pairs])
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE collection = ? AND key = ?",
+                                     (collection, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection=collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM kv WHERE collection = ?", (collection,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection=collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key))
+        return cursor.rowcount > 0
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection=collection)
+
+    def persist(self, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> None:
+        """
+        提交当前事务并写入 persist_path 所在目录的 index.sqlite
+        """
+        persist_dir = os.path.dirname(persist_path)
+        os.makedirs(persist_dir, exist_ok=True)
+        db_path = os.path.join(persist_dir, INDEX_SQLITE_FILE_NAME)
+        with self._lock:
+            self._conn.commit()
+            target = sqlite3.connect(db_path)
+            try:
+                self._conn.backup(target)
+            finally:
+                target.close()
+
+
+class SqliteDocumentStore(KVDocumentStore):
+
+    def __init__(self, kvstore: SqliteKVStore, namespace: Optional[str] = None):
+        super().__init__(kvstore, namespace=namespace)
+
+    def persist(self, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> None:
+        self._kvstore.persist(persist_path, fs=fs)
+
+
+class SqliteIndexStore(KVIndexStore):
+
+    def __init__(self, kvstore: SqliteKVStore, namespace: Optional[str] = None):
+        super().__init__(kvstore, namespace=namespace)
+
+    def persist(self, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> None:
+        self._kvstore.persist(persist_path, fs=fs)
@@ -0,0 +1,168 @@
+import asyncio
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Coroutine
+
+import torch
+
+from core.config import WHISPER_WORKERS, WHISPER_TORCH_THREADS, WHISPER_QUEUE_SIZE
+from core.logger import get_logger
+
+# 优先级，数值越小越先执行
+INTERACTIVE = 0
+BATCH = 1
+
+
+class TranscriptionQueueFullError(Exception):
+    pass
+
+
+class TranscriptionJob:
+
+    def __init__(self, job_id: str, run: Callable[[], Coroutine[Any, Any, Any]], priority: int,
+                 on_position: Callable[[int], None] | None):
+        self.job_id = job_id
+        self.run = run
+        self.priority = priority
+        self.on_position = on_position
+        self.position = None
+        self.started = False
+        # 发布排队位置与开始执行互斥，开始执行后不再发布排队位置
+        self.lock = threading.Lock()
+
+
+class TranscriptionScheduler:
+    """
+    转写任务调度器。任务按优先级排队，队列已满时拒绝提交；固定数量的工作线程各自持有一个事件循环，
+    依次执行任务。每个工作线程使用 torch_threads 个计算线程，工作线程数与之相乘不超过 CPU 核数。
+    计算资源按名额分配，每个名额对应 torch_threads 个核，共 workers 个名额；每个任务占用一个名额，
+    分段并行转写的任务通过 reserve 额外占用名额。
+    """
+
+    def __init__(self, workers: int, torch_threads: int, max_queue_size: int):
+        self.max_queue_size = max_queue_size
+        self.logger = get_logger()
+        self._queue: list[tuple[int, int, TranscriptionJob]] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._running = 0
+        self.capacity = workers
+        self._used = 0
+        self._reserving = 0
+        self.torch_threads = torch_threads
+        self._threads = [threading.Thread(target=self._run, name=f"transcription-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job_id: str, run: Callable[[], Coroutine[Any, Any, Any]], priority: int = BATCH,
+               on_position: Callable[[int], None] | None = None) -> int:
+        """
+        提交任务
+
+        :param job_id: 任务 id
+        :param run: 返回任务协程的函数，在工作线程的事件循环中执行
+        :param priority: INTERACTIVE 或 BATCH
+        :param on_position: 排队位置变化时的回调，位置从 1 开始
+        :return: 当前排队位置
+        """
+        job = TranscriptionJob(job_id, run, priority, on_position)
+        with self._condition:
+            if len(self._queue) >= self.max_queue_size:
+                raise TranscriptionQueueFullError(f"Transcription queue is full: {self.max_queue_size}")
+            heapq.heappush(self._queue, (priority, next(self._counter), job))
+            self._condition.notify_all()
+            changed = self._update_positions()
+        self._notify_positions(changed)
+        return job.position
+
+    def _update_positions(self) -> list[TranscriptionJob]:
+        changed = []
+        for position, (_, _, job) in enumerate(sorted(self._queue), start=1):
+            if job.position != position:
+                job.position = position
+                changed.append(job)
+        return changed
+
+    def _notify_positions(self, jobs: list[TranscriptionJob]):
+        for job in jobs:
+            if job.on_position is None:
+                continue
+            with job.lock:
+                if job.started:
+                    continue
+                try:
+                    job.on_position(job.position)
+                except Exception:
+                    self.logger.exception(f"Failed to publish queue position: {job.job_id}")
+
+    def _take(self) -> TranscriptionJob:
+        with self._condition:
+            # 有任务在申请额外名额时暂停取新任务，避免其一直等不到
+            while not self._queue or self._reserving or self._used >= self.capacity:
+                self._condition.wait()
+            _, _, job = heapq.heappop(self._queue)
+            self._running += 1
+            self._used += 1
+            changed = self._update_positions()
+        with job.lock:
+            job.started = True
+        self._notify_positions(changed)
+        return job
+
+    def _run(self):
+        # 只限制工作线程自己的计算线程数，不影响进程内 Embedding 等其他 torch 使用者
+        torch.set_num_threads(self.torch_threads)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            job = self._take()
+            try:
+                loop.run_until_complete(job.run())
+            except Exception:
+                self.logger.exception(f"Transcription job failed: {job.job_id}")
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    self._used -= 1
+                    self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, slots: int):
+        """
+        在工作线程中执行的任务额外占用计算名额，用于把计算分派到子进程的任务
+
+        :param slots: 需要的名额总数，包含任务本身占用的一个，不超过总名额
+        """
+        slots = min(max(slots, 1), self.capacity)
+        with self._condition:
+            # 先归还自己的名额再整体申请，多个任务同时申请时不会互相等待
+            self._used -= 1
+            self._reserving += 1
+            self._condition.notify_all()
+            while self._used + slots > self.capacity:
+                self._condition.wait()
+            self._reserving -= 1
+            self._used += slots
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._used -= slots - 1
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "workers": len(self._threads),
+                "running": self._running,
+                "capacity": self.capacity,
+                "used": self._used,
+                "queued": len(self._queue),
+                "maxQueueSize": self.max_queue_size
+            }
+
+
+transcription_scheduler = TranscriptionScheduler(WHISPER_WORKERS, WHISPER_TORCH_THREADS, WHISPER_QUEUE_SIZE)
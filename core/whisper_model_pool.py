@@ -0,0 +1,84 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+import torch
+import whisper
+
+from core.config import WHISPER_MODEL_MAX_COPIES
+from core.logger import get_logger
+
+
+class WhisperModelLease:
+    """
+    从模型池借出的模型。cold 为 True 时池中没有空闲实例，调用 load() 加载一个新的副本
+    """
+
+    def __init__(self, pool: "WhisperModelPool", name: str, model):
+        self.pool = pool
+        self.name = name
+        self.model = model
+
+    @property
+    def cold(self) -> bool:
+        return self.model is None
+
+    def load(self):
+        if self.model is None:
+            self.model = self.pool.load(self.name)
+        return self.model
+
+
+class WhisperModelPool:
+    """
+    进程内的 Whisper 模型池，按模型名称保存已加载的实例，每个模型最多 max_copies 个副本。
+    同一个实例同一时间只借给一个任务，副本都被借出时等待归还。
+    """
+
+    def __init__(self, max_copies: int):
+        self.max_copies = max_copies
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.logger = get_logger()
+        self._idle = defaultdict(list)
+        self._copies = defaultdict(int)
+        self._condition = threading.Condition()
+
+    def load(self, name: str):
+        self.logger.info(f"Loading whisper model: {name}, device: {self.device}")
+        return whisper.load_model(name, device=self.device)
+
+    @contextmanager
+    def lend(self, name: str):
+        with self._condition:
+            while not self._idle[name] and self._copies[name] >= self.max_copies:
+                self._condition.wait()
+            # 有空闲实例时直接借出，否则占用一个副本名额，由调用方加载
+            model = self._idle[name].pop() if self._idle[name] else None
+            if model is None:
+                self._copies[name] += 1
+        lease = WhisperModelLease(self, name, model)
+        try:
+            yield lease
+        finally:
+            with self._condition:
+                if lease.model is not None:
+                    self._idle[name].append(lease.model)
+                else:
+                    # 加载失败，释放副本名额
+                    self._copies[name] -= 1
+                self._condition.notify()
+
+    def warmup(self, names: list[str]):
+        """
+        启动时为每个模型预加载一个副本
+        """
+        for name in filter(None, dict.fromkeys(names)):
+            with self.lend(name) as lease:
+                lease.load()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {name: {"copies": copies, "idle": len(self._idle[name])} for name, copies in self._copies.items()}
+
+
+whisper_model_pool = WhisperModelPool(WHISPER_MODEL_MAX_COPIES)
@@ -0,0 +1,47 @@
+"""
+将 JSON 格式(SimpleVectorStore)的持久化索引转换为 npy 格式
+
+用法: python migrate_vector_store.py [--keep-json] [persist_root ...]
+默认转换 RAG_PERSIST_DIR 与 GITHUB_PERSIST_DIR 下的全部索引
+"""
+import argparse
+import os
+
+from llama_index.core.vector_stores import SimpleVectorStore
+
+from constants.data_connect_constants import GITHUB_PERSIST_DIR
+from constants.rag_constants import RAG_PERSIST_DIR
+from core.numpy_vector_store import NumpyVectorStore
+
+JSON_VECTOR_STORE_FILE_NAME = "default__vector_store.json"
+
+
+def migrate_persist_dir(persist_dir: str, keep_json: bool = False) -> bool:
+    json_path = os.path.join(persist_dir, JSON_VECTOR_STORE_FILE_NAME)
+    if NumpyVectorStore.exists(persist_dir) or not os.path.exists(json_path):
+        return False
+    simple_vector_store = SimpleVectorStore.from_persist_path(json_path)
+    vector_store = NumpyVectorStore.from_embedding_dict(simple_vector_store.data.embedding_dict,
+                                                        simple_vector_store.data.text_id_to_ref_doc_id)
+    vector_store.persist(json_path)
+    if not keep_json:
+        os.remove(json_path)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert JSON vector stores to npy format")
+    parser.add_argument("roots", nargs="*", default=[RAG_PERSIST_DIR, GITHUB_PERSIST_DIR])
+    parser.add_argument("--keep-json", action="store_true", help="keep default__vector_store.json after migration")
+    args = parser.parse_args()
+
+    for root in args.roots:
+        for persist_dir, _, files in os.walk(root):
+            if JSON_VECTOR_STORE_FILE_NAME not in files:
+                continue
+            if migrate_persist_dir(persist_dir, args.keep_json):
+                print(f"migrated: {persist_dir}")
+
+
+if __name__ == "__main__":
+    main()
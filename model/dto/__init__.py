@@ -6,3 +6,4 @@ from .pandas_query_dto import PandasQueryDTO
 from .github_query_dto import GithubQueryDTO
 from .github_index_dto import GithubIndexDTO
 from .whisper_run_dto import WhisperRunDTO
+from .rag_multi_query_dto import RagMultiQueryDTO
@@ -0,0 +1,7 @@
+from pydantic import BaseModel, Field
+
+
+class RagMultiQueryDTO(BaseModel):
+    # 需要检索的文件哈希
+    file_hashes: list[str] = Field(min_length=1)
+    prompt: str
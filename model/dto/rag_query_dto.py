@@ -12,3 +12,5 @@ class RagQueryDTO(BaseModel):
     category: str
     # 描述
     description: str
+    # 查询模式 direct / agent，为空时单文档使用 direct
+    mode: str | None = None
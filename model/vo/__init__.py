@@ -4,3 +4,4 @@ from .pandas_query_vo import PandasQueryVO
 from .github_query_vo import GithubQueryVO
 from .whisper_run_vo import WhisperRunVO
 from .whisper_submit_vo import WhisperSubmitVO
+from .rag_index_submit_vo import RagIndexSubmitVO
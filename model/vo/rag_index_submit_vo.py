@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+
+
+class RagIndexSubmitVO(BaseModel):
+    job_id: str
+
+    def to_dict(self):
+        return {
+            "jobId": self.job_id
+        }
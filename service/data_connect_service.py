@@ -1,48 +1,33 @@
 import os.path
 
-from llama_index.embeddings.openai import OpenAIEmbedding
-
 from core.redis_server import RedisServer
 from model.dto import GithubIndexDTO, GithubQueryDTO
 from model.vo import GithubQueryVO
 from llama_index.readers.github import GithubRepositoryReader, GithubClient
 from core.config import GITHUB_TOKEN
-from llama_index.core import VectorStoreIndex, ServiceContext, load_index_from_storage, StorageContext, Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.core import VectorStoreIndex
+from llama_index.core.constants import DEFAULT_SIMILARITY_TOP_K
+from llama_index.core.query_engine import RetrieverQueryEngine
 from constants.data_connect_constants import GITHUB_PERSIST_DIR
 from exceptions import BusinessException
 from llama_index.core.node_parser import SentenceSplitter
-from core.config import CODE_EMBEDDING_MODEL
+from core.config import CODE_EMBEDDING_MODEL, ANN_MIN_NODES, HYBRID_SEARCH, HYBRID_RRF_K
+from core.model_registry import model_registry
+from core.index_cache import index_cache
+from core.index_storage import load_index, new_storage_context, persist_index, build_keyword_index
+from core.bm25_index import Bm25Index, BM25_FILE_NAME
+from core.hybrid_retriever import HybridRetriever
+from core.cached_retriever import CachedRetriever
+from core.retrieval_cache import retrieval_cache
+from core.numpy_vector_store import NumpyVectorStore
+from utils.embedding_util import embed_nodes
 
 
 class DataConnectService:
 
-    def get_embed_model(self, model: str):
-        # if "mistral" == EMBEDDING_MODEL:
-        #     return OllamaEmbedding(
-        #         model_name="mistral",
-        #         base_url="http://localhost:11434",
-        #         ollama_additional_kwargs={"mirostat": 0},
-        #     )
-        # elif "sentence-transformers/all-mpnet-base-v2" == EMBEDDING_MODEL:
-        #     return HuggingFaceEmbedding(
-        #         model_name="sentence-transformers/all-mpnet-base-v2", max_length=512
-        #     )
-        if "BAAI/bge-small-zh-v1.5" == model:
-            self.logger.info("Using BAAI/bge-small")
-            return HuggingFaceEmbedding(model_name=model)
-        elif "BAAI/bge-small-en-v1.5" == model:
-            self.logger.info("BAAI/bge-small-en-v1.5")
-            return HuggingFaceEmbedding(model_name=model)
-
-        if model is not None:
-            return OpenAIEmbedding(model_name=model)
-        return OpenAIEmbedding(model_name="text-embedding-ada-002")
-
     def __init__(self, redis_server: RedisServer):
         self.redis_server = redis_server
-        Settings.embed_model = self.get_embed_model(CODE_EMBEDDING_MODEL)
-        pass
+        self.embed_model = model_registry.get_embed_model(CODE_EMBEDDING_MODEL)
 
     def get_base_node_parser(self):
         return SentenceSplitter()
@@ -60,10 +45,17 @@ class DataConnectService:
         # index = VectorStoreIndex.from_documents(documents, service_context=ServiceContext
         #                                         .from_defaults(
         #     embed_model=HuggingFaceEmbedding("BAAI/bge-small-en-v1.5")))
-        index = VectorStoreIndex(nodes, service_context=ServiceContext
-                                 .from_defaults(embed_model=self.get_embed_model(CODE_EMBEDDING_MODEL)))
-        index.storage_context.persist(
-            persist_dir=f"{GITHUB_PERSIST_DIR}/{github_index_dto.owner}/{github_index_dto.repo}/{github_index_dto.branch}")
+        embed_nodes(self.embed_model, nodes)
+        index = VectorStoreIndex(nodes, storage_context=new_storage_context(), embed_model=self.embed_model)
+        vector_store = index.storage_context.vector_store
+        # 节点较少时精确检索已经足够快，不构建近似索引
+        if isinstance(vector_store, NumpyVectorStore) and len(nodes) >= ANN_MIN_NODES:
+            vector_store.build_ann()
+        vector_index_path = f"{GITHUB_PERSIST_DIR}/{github_index_dto.owner}/{github_index_dto.repo}/{github_index_dto.branch}"
+        keyword_index = build_keyword_index(nodes) if HYBRID_SEARCH else None
+        persist_index(index, vector_index_path, overwrite=True, keyword_index=keyword_index)
+        index_cache.invalidate(vector_index_path)
+        retrieval_cache.invalidate(vector_index_path)
 
     def index_github(self, github_index_dto: GithubIndexDTO):
         self.build_github_index(github_index_dto)
@@ -74,7 +66,15 @@ class DataConnectService:
         if not os.path.exists(vector_index_path):
             raise BusinessException("索引不存在")
 
-        index = load_index_from_storage(StorageContext.from_defaults(persist_dir=vector_index_path))
-        query_engine = index.as_query_engine()
+        index = index_cache.get(vector_index_path, lambda: load_index(vector_index_path, self.embed_model))
+        retriever = index.as_retriever()
+        if HYBRID_SEARCH and Bm25Index.exists(vector_index_path):
+            keyword_index_path = os.path.join(vector_index_path, BM25_FILE_NAME)
+            keyword_index = index_cache.get(keyword_index_path, lambda: Bm25Index.load(keyword_index_path))
+            retriever = HybridRetriever(retriever, keyword_index, index.docstore, DEFAULT_SIMILARITY_TOP_K,
+                                        rrf_k=HYBRID_RRF_K)
+        retriever = CachedRetriever(retriever, retrieval_cache, vector_index_path, self.embed_model, index.docstore,
+                                    DEFAULT_SIMILARITY_TOP_K)
+        query_engine = RetrieverQueryEngine.from_args(retriever)
         response = query_engine.query(github_query_dto.prompt)
         return GithubQueryVO(message=str(response))
@@ -1,98 +1,113 @@
-# import uuid
+import uuid
+from typing import Callable
 
-from llama_index.core import VectorStoreIndex, load_index_from_storage, StorageContext, SimpleDirectoryReader
+from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
 from llama_index.core.tools import QueryEngineTool, ToolMetadata
-from llama_index.llms.openai import OpenAI
-from llama_index.llms.ollama import Ollama
 from llama_index.core.node_parser import SentenceWindowNodeParser
 from llama_index.core.node_parser import SentenceSplitter
 import time
 import json
-from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.readers.github import GithubRepositoryReader, GithubClient
 from llama_index.core.postprocessor import MetadataReplacementPostProcessor
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.prompts.default_prompts import DEFAULT_TEXT_QA_PROMPT
 #
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 # from llama_index.embeddings.ollama import OllamaEmbedding
 from llama_index.core.agent import AgentRunner, ReActAgent
 # from llama_index.agent.openai import OpenAIAgentWorker, OpenAIAgent
 # from llama_index.agent.openai import OpenAIAgentWorker
 # from core.config import OPENAI_API_KEY
 # from core.redis_server import RedisServer
-from model.dto import RagFileIndexDTO, RagQueryDTO
+from model.dto import RagFileIndexDTO, RagQueryDTO, RagMultiQueryDTO
 from utils import download_file
 import os
-from constants.rag_constants import RAG_PDF_DIR, RAG_PERSIST_DIR, RAG_TASK_REDIS_PREFIX
+from constants.rag_constants import RAG_PDF_DIR, RAG_PERSIST_DIR, RAG_TASK_REDIS_PREFIX, RAG_INDEX_JOB_EXPIRE, \
+    RAG_INDEX_LOCK_EXPIRE, RAG_INDEX_JOB_END_STATUS, RAG_TASK_END_STATUS, RAG_HEARTBEAT_INTERVAL, RAG_QUERY_MODE_DIRECT, RAG_QUERY_MODE_AGENT
+from constants.redis_constants import RAG_INDEX_JOB_STATUS, RAG_INDEX_LOCK, RAG_INDEX_FOLLOWERS
+from constants.redis_channel_constants import RAG_INDEX_JOB_STATUS_CHANNEL, RAG_TASK_STATUS_CHANNEL
 from model.dto import FileDownloadDTO, GithubQueryDTO
 from exceptions import BusinessException
-from model.vo import RagFileIndexVO, RagQueryVO
+from model.vo import RagFileIndexVO, RagQueryVO, RagIndexSubmitVO
 from core.logger import get_logger
-from core.config import RAG_LLM_MODEL, RAG_EMBEDDING_MODEL, BASE_PROMPT, GITHUB_TOKEN
+from core.config import RAG_LLM_MODEL, RAG_EMBEDDING_MODEL, BASE_PROMPT, GITHUB_TOKEN, RAG_SIMILARITY_TOP_K, \
+    RAG_CONTEXT_TOKEN_BUDGET, HYBRID_SEARCH, HYBRID_RRF_K
 from core.redis_server import RedisServer
-from llama_index.core import Settings, ServiceContext
+from core.model_registry import model_registry
+from core.index_cache import index_cache
+from core.index_storage import load_index, new_storage_context, persist_index, build_keyword_index
+from core.bm25_index import Bm25Index, BM25_FILE_NAME
+from core.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from core.cached_retriever import CachedRetriever
+from core.retrieval_cache import retrieval_cache
+from core.aio_redis_server import AIORedisServer
+from core.executor import index_executor, retrieval_executor
+from core.redis_lock import RedisLockLease, redis_lock_watcher
+from utils.embedding_util import embed_nodes
+from utils.sse_util import format_sse
+from core.queue_callback_handler import QueueCallbackHandler
+from core.rag_answer_cache import rag_answer_cache
+from core.context_packer import ContextPacker
 # from core.redis import get_redis_pool
 import asyncio
+import threading
 # from model.dto import ResData
 
 class RagService:
 
-    def get_model(self):
-        if "mistral" == RAG_LLM_MODEL:
-            return Ollama(model="mistral", request_timeout=300.0)
-        elif "llama3" == RAG_LLM_MODEL:
-            return Ollama(model="llama3", request_timeout=300.0)
-        elif "qwen2" == RAG_LLM_MODEL:
-            return Ollama(model="qwen2", request_timeout=300.0)
-        elif "gemma" == RAG_LLM_MODEL:
-            return Ollama(model="gemma", request_timeout=300.0)
-        else:
-            return OpenAI(model=RAG_LLM_MODEL)
-
-    def get_embed_model(self, model: str):
-        # if "mistral" == EMBEDDING_MODEL:
-        #     return OllamaEmbedding(
-        #         model_name="mistral",
-        #         base_url="http://localhost:11434",
-        #         ollama_additional_kwargs={"mirostat": 0},
-        #     )
-        # elif "sentence-transformers/all-mpnet-base-v2" == EMBEDDING_MODEL:
-        #     return HuggingFaceEmbedding(
-        #         model_name="sentence-transformers/all-mpnet-base-v2", max_length=512
-        #     )
-        if "BAAI/bge-small-zh-v1.5" == model:
-            self.logger.info("Using BAAI/bge-small")
-            return HuggingFaceEmbedding(model_name=model)
-        elif "BAAI/bge-small-en-v1.5" == model:
-            self.logger.info("BAAI/bge-small-en-v1.5")
-            return HuggingFaceEmbedding(model_name=model)
-
-        if model is not None:
-            print(RAG_EMBEDDING_MODEL)
-            return OpenAIEmbedding(model_name=model)
-        return OpenAIEmbedding(model_name="text-embedding-ada-002")
-
     def __init__(self, redis_server: RedisServer):
         self.redis_server = redis_server
-        self.llm = self.get_model()
-        # self.embed_model = self.get_embed_model()
         self.logger = get_logger()
-        Settings.embed_model = self.get_embed_model(RAG_EMBEDDING_MODEL)
+        self.llm = model_registry.get_llm(RAG_LLM_MODEL)
+        self.embed_model = model_registry.get_embed_model(RAG_EMBEDDING_MODEL)
+        self.answer_cache = rag_answer_cache
 
-    def get_query_engine_tool(self, hash_value: str, file_name: str, author: str, category: str, description: str):
+    def get_vector_index(self, hash_value: str):
         vector_index_path = f"{RAG_PERSIST_DIR}/{hash_value}"
         if not os.path.exists(vector_index_path):
             raise BusinessException("文件索引不存在")
+        return index_cache.get(vector_index_path, lambda: load_index(vector_index_path, self.embed_model))
 
-        vector_index = load_index_from_storage(
-            StorageContext.from_defaults(persist_dir=vector_index_path)
-        )
+    def get_keyword_index(self, hash_value: str) -> Bm25Index | None:
+        vector_index_path = f"{RAG_PERSIST_DIR}/{hash_value}"
+        if not HYBRID_SEARCH or not Bm25Index.exists(vector_index_path):
+            return None
+        keyword_index_path = os.path.join(vector_index_path, BM25_FILE_NAME)
+        return index_cache.get(keyword_index_path, lambda: Bm25Index.load(keyword_index_path))
+
+    def get_base_retriever(self, hash_value: str):
+        """
+        向量检索器，有关键词索引时为混合检索器
+        """
+        vector_index = self.get_vector_index(hash_value)
+        retriever = vector_index.as_retriever(similarity_top_k=RAG_SIMILARITY_TOP_K)
+        keyword_index = self.get_keyword_index(hash_value)
+        if keyword_index is not None:
+            retriever = HybridRetriever(retriever, keyword_index, vector_index.docstore, RAG_SIMILARITY_TOP_K,
+                                        rrf_k=HYBRID_RRF_K)
+        return retriever
 
-        query_engine = vector_index.as_query_engine(
-            similarity_top_k=10,
+    def get_retriever(self, hash_value: str, callback_manager: CallbackManager | None = None):
+        vector_index = self.get_vector_index(hash_value)
+        retriever = self.get_base_retriever(hash_value)
+        retriever = CachedRetriever(retriever, retrieval_cache, f"{RAG_PERSIST_DIR}/{hash_value}", self.embed_model,
+                                    vector_index.docstore, RAG_SIMILARITY_TOP_K)
+        if callback_manager is not None:
+            retriever.callback_manager = callback_manager
+        return retriever
+
+    def get_node_postprocessors(self):
+        return [MetadataReplacementPostProcessor(target_metadata_key="window"),
+                ContextPacker(token_budget=RAG_CONTEXT_TOKEN_BUDGET, model=RAG_LLM_MODEL)]
+
+    def get_query_engine_tool(self, hash_value: str, file_name: str, author: str, category: str, description: str,
+                              callback_manager: CallbackManager | None = None):
+        query_engine = RetrieverQueryEngine.from_args(
+            self.get_retriever(hash_value, callback_manager),
             llm=self.llm,
-            node_postprocessors=[
-                MetadataReplacementPostProcessor(target_metadata_key="window")
-            ],
+            node_postprocessors=self.get_node_postprocessors(),
+            callback_manager=callback_manager
         )
         query_engine_tool = QueryEngineTool(
             query_engine=query_engine,
@@ -119,16 +134,33 @@ class RagService:
     def get_base_node_parser(self):
         return SentenceSplitter()
 
-    def build_vector_index(self, file_download_dto: FileDownloadDTO):
+    def build_vector_index(self, file_download_dto: FileDownloadDTO,
+                           progress_callback: Callable[[str, int, int], None] | None = None):
+        """
+        构建并持久化文档索引，索引已存在时直接返回
 
+        :param file_download_dto: 下载的文件
+        :param progress_callback: 进度回调，参数为 (阶段, 已完成数量, 总数量)
+        """
         vector_index_path = f"{RAG_PERSIST_DIR}/{file_download_dto.hash_value}"
-        if not os.path.exists(vector_index_path):
-            self.logger.info(f"Start index: {vector_index_path}")
-            node_parser = self.get_node_parser()
-            documents = self.load_documents([file_download_dto.file_path])
-            nodes = node_parser.get_nodes_from_documents(documents)
-            vector_index = VectorStoreIndex(nodes)
-            vector_index.storage_context.persist(persist_dir=vector_index_path)
+        if os.path.exists(vector_index_path):
+            return vector_index_path
+        if progress_callback is None:
+            progress_callback = lambda status, current, total: None
+
+        self.logger.info(f"Start index: {vector_index_path}")
+        progress_callback("PARSING", 0, 0)
+        node_parser = self.get_node_parser()
+        documents = self.load_documents([file_download_dto.file_path])
+        nodes = node_parser.get_nodes_from_documents(documents)
+        embed_nodes(self.embed_model, nodes, lambda current, total: progress_callback("EMBEDDING", current, total))
+        progress_callback("PERSISTING", 0, 0)
+        vector_index = VectorStoreIndex(nodes, storage_context=new_storage_context(), embed_model=self.embed_model)
+        keyword_index = build_keyword_index(nodes) if HYBRID_SEARCH else None
+        if persist_index(vector_index, vector_index_path, keyword_index=keyword_index):
+            index_cache.invalidate(vector_index_path)
+            retrieval_cache.invalidate(vector_index_path)
+            self.answer_cache.invalidate(file_download_dto.hash_value)
         return vector_index_path
 
     def index_pdf(self, rag_file_index_dto: RagFileIndexDTO) -> RagFileIndexVO:
@@ -140,7 +172,194 @@ class RagService:
         self.build_vector_index(file_download_dto)
         return RagFileIndexVO(hash=file_download_dto.hash_value)
 
-    async def run_agent(self, query_engines, llm, prompt: str, task_id: str):
+    def update_index_job(self, job_id: str, status: str, current: int = 0, total: int = 0, hash_value: str = ""):
+        data = {
+            "id": job_id,
+            "status": status,
+            "progress": {
+                "current": current,
+                "total": total
+            },
+            "result": {
+                "hash": hash_value
+            }
+        }
+        self.redis_server.set_ex(f"{RAG_INDEX_JOB_STATUS}:{job_id}", data, RAG_INDEX_JOB_EXPIRE)
+        self.redis_server.publish(f"{RAG_INDEX_JOB_STATUS_CHANNEL}:{job_id}", data)
+
+    def submit_index_job(self, rag_file_index_dto: RagFileIndexDTO) -> RagIndexSubmitVO:
+        job_id = uuid.uuid4().__str__()
+        self.update_index_job(job_id, "PENDING")
+        index_executor.submit(self.run_index_job, rag_file_index_dto, job_id)
+        return RagIndexSubmitVO(job_id=job_id)
+
+    def run_index_job(self, rag_file_index_dto: RagFileIndexDTO, job_id: str):
+        try:
+            self.update_index_job(job_id, "DOWNLOADING")
+            file_download_dto = download_file(rag_file_index_dto.file_path, RAG_PDF_DIR)
+            if not file_download_dto:
+                raise BusinessException("下载文件失败")
+            hash_value = file_download_dto.hash_value
+            lock_key = f"{RAG_INDEX_LOCK}:{hash_value}"
+            # 相同内容的文件只构建一次，其余任务等待构建完成
+            if not self.redis_server.set_nx_ex(lock_key, job_id, RAG_INDEX_LOCK_EXPIRE):
+                self.attach_index_job(rag_file_index_dto, job_id, hash_value)
+                return
+            try:
+                # 构建期间定时续期，退出时释放锁
+                with RedisLockLease(self.redis_server, lock_key, job_id, RAG_INDEX_LOCK_EXPIRE):
+                    self.build_vector_index(file_download_dto, lambda status, current, total: self.update_index_job(
+                        job_id, status, current, total, hash_value))
+                self.update_index_job(job_id, "FINISHED", hash_value=hash_value)
+            finally:
+                self.finish_attached_index_jobs(hash_value)
+        except Exception:
+            self.logger.exception(f"RAG INDEX ERROR, job_id: {job_id}")
+            self.update_index_job(job_id, "FAILED")
+
+    def attach_index_job(self, rag_file_index_dto: RagFileIndexDTO, job_id: str, hash_value: str):
+        """
+        等待相同文件的构建任务完成。构建任务所在进程退出时锁很快过期，由 redis_lock_watcher 重新提交
+        """
+        self.logger.info(f"Attach index job {job_id} to running build of {hash_value}")
+        self.update_index_job(job_id, "WAITING", hash_value=hash_value)
+        lock_key = f"{RAG_INDEX_LOCK}:{hash_value}"
+        followers_key = f"{RAG_INDEX_FOLLOWERS}:{hash_value}"
+        self.redis_server.sadd(followers_key, job_id)
+        # 构建任务可能在加入等待集合前已经结束
+        if self.redis_server.get(lock_key) is None:
+            self.finish_attached_index_jobs(hash_value)
+            return
+        redis_lock_watcher.watch(self.redis_server, lock_key, followers_key, job_id,
+                                 lambda: index_executor.submit(self.run_index_job, rag_file_index_dto, job_id))
+
+    def finish_attached_index_jobs(self, hash_value: str):
+        status = "FINISHED" if os.path.exists(f"{RAG_PERSIST_DIR}/{hash_value}") else "FAILED"
+        for job_id in self.redis_server.pop_members(f"{RAG_INDEX_FOLLOWERS}:{hash_value}"):
+            self.update_index_job(job_id, status, hash_value=hash_value)
+
+    def get_index_job(self, job_id: str):
+        data = self.redis_server.get(f"{RAG_INDEX_JOB_STATUS}:{job_id}")
+        if data is None:
+            raise BusinessException("任务不存在")
+        return data
+
+    async def get_index_job_stream(self, job_id: str):
+        channel = f"{RAG_INDEX_JOB_STATUS_CHANNEL}:{job_id}"
+        status_key = f"{RAG_INDEX_JOB_STATUS}:{job_id}"
+        async for data in AIORedisServer().watch(channel, status_key):
+            if data is None:
+                data = {"id": job_id, "status": "NOT_FOUND", "progress": {}, "result": {}}
+            yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps(data))
+            if data["status"] == "NOT_FOUND" or data["status"] in RAG_INDEX_JOB_END_STATUS:
+                break
+
+    def set_task_state(self, task_id: str, data: dict):
+        self.redis_server.set(f"{RAG_TASK_REDIS_PREFIX}:{task_id}", data)
+        self.redis_server.publish(f"{RAG_TASK_STATUS_CHANNEL}:{task_id}", data)
+
+    def get_query_mode(self, rag_query_dto: RagQueryDTO) -> str:
+        # 单文档查询只有一个工具，不需要 Agent 选择工具，默认直接检索后生成回答
+        mode = rag_query_dto.mode or RAG_QUERY_MODE_DIRECT
+        if mode not in (RAG_QUERY_MODE_DIRECT, RAG_QUERY_MODE_AGENT):
+            raise BusinessException("不支持的查询模式")
+        return mode
+
+    async def stream_answer(self, nodes: list[NodeWithScore], prompt: str, query_str: str):
+        """
+        使用检索到的节点调用一次 LLM 生成回答，逐个返回生成的文本片段
+
+        :param nodes: 检索到的节点
+        :param prompt: 带有 BASE_PROMPT 的问题
+        :param query_str: 用于检索的原始问题
+        """
+        for node_postprocessor in self.get_node_postprocessors():
+            nodes = node_postprocessor.postprocess_nodes(nodes, query_str=query_str)
+        context_str = "\n\n".join(node.node.get_content(metadata_mode=MetadataMode.LLM) for node in nodes)
+        response = await self.llm.astream_complete(
+            DEFAULT_TEXT_QA_PROMPT.format(context_str=context_str, query_str=prompt))
+        async for chunk in response:
+            yield chunk.delta or ""
+
+    async def stream_direct_answer(self, retriever, prompt: str, query_str: str):
+        nodes = await retriever.aretrieve(query_str)
+        async for delta in self.stream_answer(nodes, prompt, query_str):
+            yield delta
+
+    async def retrieve_many(self, file_hashes: list[str], query_str: str,
+                            callback_manager: CallbackManager | None = None) -> list[NodeWithScore]:
+        """
+        在线程池中并行检索多个文档的索引，取全局 top k。
+        RRF 分数只与排名有关，不能跨索引比较，因此先把各索引的向量结果按相似度、关键词结果按 BM25 分数
+        分别合并成全局排名，再对两路全局排名做一次融合
+        """
+        # 所有索引使用同一个 Embedding 模型，问题只需要计算一次向量
+        embedding = retrieval_cache.get_embedding(self.embed_model.model_name, query_str)
+        if embedding is None:
+            embedding = await self.embed_model.aget_query_embedding(query_str)
+            retrieval_cache.put_embedding(self.embed_model.model_name, query_str, embedding)
+        query_bundle = QueryBundle(query_str, embedding=embedding)
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[loop.run_in_executor(
+            retrieval_executor, self.retrieve_rankings, file_hash, query_bundle, callback_manager)
+            for file_hash in file_hashes])
+        vector_nodes = sorted([node for vector_result, _ in results for node in vector_result],
+                              key=lambda node: node.score or 0, reverse=True)
+        keyword_nodes = sorted([node for _, keyword_result in results for node in keyword_result],
+                               key=lambda node: node.score or 0, reverse=True)
+        if not keyword_nodes:
+            return vector_nodes[:RAG_SIMILARITY_TOP_K]
+        return reciprocal_rank_fusion([vector_nodes, keyword_nodes], RAG_SIMILARITY_TOP_K, HYBRID_RRF_K)
+
+    def retrieve_rankings(self, hash_value: str, query_bundle: QueryBundle,
+                          callback_manager: CallbackManager | None = None) \
+            -> tuple[list[NodeWithScore], list[NodeWithScore]]:
+        """
+        :return: (向量检索结果, 关键词检索结果)，没有关键词索引时后者为空
+        """
+        retriever = self.get_base_retriever(hash_value)
+        if callback_manager is not None:
+            retriever.callback_manager = callback_manager
+        if isinstance(retriever, HybridRetriever):
+            return retriever.retrieve_rankings(query_bundle)
+        return retriever.retrieve(query_bundle), []
+
+    async def stream_multi_answer(self, file_hashes: list[str], prompt: str, query_str: str,
+                                  callback_manager: CallbackManager | None = None):
+        nodes = await self.retrieve_many(file_hashes, query_str, callback_manager)
+        async for delta in self.stream_answer(nodes, prompt, query_str):
+            yield delta
+
+    async def stream_agent_answer(self, query_engines, prompt: str, callback_manager: CallbackManager | None = None):
+        """
+        ReActAgent 的流式接口会在事件循环中同步调用工具，检索和生成回答期间阻塞事件循环，
+        因此在单独的线程中运行 Agent，生成的文本片段通过队列转发
+        """
+        loop = asyncio.get_running_loop()
+        deltas: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def run_agent():
+            agent = ReActAgent.from_tools(
+                query_engines, llm=self.llm, max_iterations=20, verbose=True, callback_manager=callback_manager
+            )
+            response = agent.stream_chat(prompt)
+            for delta in response.response_gen:
+                if cancelled.is_set():
+                    return
+                loop.call_soon_threadsafe(deltas.put_nowait, delta)
+
+        agent_task = asyncio.ensure_future(asyncio.to_thread(run_agent))
+        # 线程中的文本片段都先于结束标记进入队列
+        agent_task.add_done_callback(lambda _: deltas.put_nowait(None))
+        try:
+            while (delta := await deltas.get()) is not None:
+                yield delta
+            await agent_task
+        finally:
+            cancelled.set()
+
+    async def run_agent(self, query_engines, llm, prompt: str, task_id: str, rag_query_dto: RagQueryDTO):
         try:
             agent = ReActAgent.from_tools(
                 query_engines, llm=llm, max_iterations=20, verbose=True
@@ -148,122 +367,182 @@ class RagService:
             response = await agent.achat(prompt)
         except Exception as e:
             self.logger.exception("RAG ERROR")
-            self.redis_server.set(f"{RAG_TASK_REDIS_PREFIX}:{task_id}", {
+            data = {
                 "id": task_id,
                 "status": "failed",
                 "result": ""
-            })
-            return {
+            }
+        else:
+            data = {
+                "id": task_id,
+                "status": "finished",
+                "result": str(response)
+            }
+            await asyncio.to_thread(self.answer_cache.put, rag_query_dto.file_hash, rag_query_dto.prompt,
+                                    self.get_query_mode(rag_query_dto), data["result"])
+        self.set_task_state(task_id, data)
+        return data
+
+    async def run_direct(self, retriever, prompt: str, task_id: str, rag_query_dto: RagQueryDTO):
+        try:
+            result = "".join([delta async for delta in self.stream_direct_answer(retriever, prompt,
+                                                                                 rag_query_dto.prompt)])
+        except Exception:
+            self.logger.exception("RAG ERROR")
+            data = {
                 "id": task_id,
                 "status": "failed",
                 "result": ""
             }
-        self.redis_server.set(f"{RAG_TASK_REDIS_PREFIX}:{task_id}", {
-            "id": task_id,
-            "status": "finished",
-            "result": str(response)
-        })
-        return {
-            "id": task_id,
-            "status": "finished",
-            "result": str(response)
-        }
+        else:
+            data = {
+                "id": task_id,
+                "status": "finished",
+                "result": result
+            }
+            await asyncio.to_thread(self.answer_cache.put, rag_query_dto.file_hash, rag_query_dto.prompt,
+                                    self.get_query_mode(rag_query_dto), result)
+        self.set_task_state(task_id, data)
+        return data
 
-    def query(self, rag_query_dto: RagQueryDTO, task_id: str):
+    async def query(self, rag_query_dto: RagQueryDTO, task_id: str):
         self.logger.info(f"START RAG QUERY, hash: {rag_query_dto.file_hash}, prompt: {rag_query_dto.prompt}")
-        query_engine = self.get_query_engine_tool(rag_query_dto.file_hash, rag_query_dto.file_name,
-                                                  rag_query_dto.author, rag_query_dto.category,
-                                                  rag_query_dto.description)
-        # agent = ReActAgent.from_tools(
-        #     [query_engine], llm=self.llm, verbose=True, max_iterations=20
-        # )
-        self.redis_server.set(f"{RAG_TASK_REDIS_PREFIX}:{task_id}", {
+        mode = self.get_query_mode(rag_query_dto)
+        cached_answer = await asyncio.to_thread(self.answer_cache.get, rag_query_dto.file_hash, rag_query_dto.prompt,
+                                                mode)
+        if cached_answer is not None:
+            self.logger.info(f"RAG ANSWER CACHE HIT, task_id: {task_id}")
+            self.set_task_state(task_id, {
+                "id": task_id,
+                "status": "finished",
+                "result": cached_answer
+            })
+            return
+        if mode == RAG_QUERY_MODE_DIRECT:
+            retriever = self.get_retriever(rag_query_dto.file_hash)
+        else:
+            query_engine = self.get_query_engine_tool(rag_query_dto.file_hash, rag_query_dto.file_name,
+                                                      rag_query_dto.author, rag_query_dto.category,
+                                                      rag_query_dto.description)
+        self.set_task_state(task_id, {
             "id": task_id,
             "status": "running",
             "result": ""
         })
         prompt = f"{BASE_PROMPT}{rag_query_dto.prompt}"
-        self.logger.info(prompt)
-        asyncio.create_task(self.run_agent([query_engine], self.llm, prompt, task_id))
-
-    async def send_heartbeat(self, task_id: str):
-        while True:
-            self.logger.info(f"taskid: {task_id}, heartbeat")
-            yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps({
-                "id": task_id,
-                "status": "running",
-                "result": ""
-            }))
-            await asyncio.sleep(5)
+        self.logger.info(f"{mode}: {prompt}")
+        if mode == RAG_QUERY_MODE_DIRECT:
+            asyncio.create_task(self.run_direct(retriever, prompt, task_id, rag_query_dto))
+        else:
+            asyncio.create_task(self.run_agent([query_engine], self.llm, prompt, task_id, rag_query_dto))
 
-    async def run_agent_v2(self, query_engines, llm, prompt: str, task_id: str):
+    async def run_stream_v2(self, answer_stream, task_id: str, event_queue: asyncio.Queue,
+                            rag_query_dto: RagQueryDTO | None = None):
+        result = ""
         try:
-            agent = ReActAgent.from_tools(
-                query_engines, llm=llm, max_iterations=20, verbose=True
-            )
-            response = await agent.achat(prompt)
-        except Exception as e:
+            async for delta in answer_stream:
+                result += delta
+                await event_queue.put(("token", {
+                    "id": task_id,
+                    "status": "running",
+                    "delta": delta
+                }))
+        except Exception:
             self.logger.exception("RAG ERROR")
-            self.redis_server.set(f"{RAG_TASK_REDIS_PREFIX}:{task_id}", {
+            data = {
                 "id": task_id,
                 "status": "failed",
                 "result": ""
-            })
-            return {
+            }
+        else:
+            data = {
                 "id": task_id,
-                "status": "failed",
-                "result": ""
+                "status": "finished",
+                "result": result
             }
-        self.redis_server.set(f"{RAG_TASK_REDIS_PREFIX}:{task_id}", {
-            "id": task_id,
-            "status": "finished",
-            "result": str(response)
-        })
-        return {
-            "id": task_id,
-            "status": "finished",
-            "result": str(response)
-        }
+            if rag_query_dto is not None:
+                await asyncio.to_thread(self.answer_cache.put, rag_query_dto.file_hash, rag_query_dto.prompt,
+                                        self.get_query_mode(rag_query_dto), result)
+        self.set_task_state(task_id, data)
+        await event_queue.put(("message", data))
 
     async def query_v2(self, rag_query_dto: RagQueryDTO, task_id: str):
-        query_engine = self.get_query_engine_tool(rag_query_dto.file_hash, rag_query_dto.file_name,
-                                                  rag_query_dto.author, rag_query_dto.category,
-                                                  rag_query_dto.description)
+        mode = self.get_query_mode(rag_query_dto)
+        cached_answer = await asyncio.to_thread(self.answer_cache.get, rag_query_dto.file_hash, rag_query_dto.prompt,
+                                                mode)
+        if cached_answer is not None:
+            self.logger.info(f"RAG ANSWER CACHE HIT, task_id: {task_id}")
+            yield format_sse({
+                "id": task_id,
+                "status": "finished",
+                "result": cached_answer
+            })
+            return
+        event_queue = asyncio.Queue()
+        callback_manager = CallbackManager([QueueCallbackHandler(task_id, event_queue, asyncio.get_running_loop())])
         prompt = f"{BASE_PROMPT}{rag_query_dto.prompt}"
-        yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps({
+        if mode == RAG_QUERY_MODE_DIRECT:
+            answer_stream = self.stream_direct_answer(self.get_retriever(rag_query_dto.file_hash, callback_manager),
+                                                      prompt, rag_query_dto.prompt)
+        else:
+            query_engine = self.get_query_engine_tool(rag_query_dto.file_hash, rag_query_dto.file_name,
+                                                      rag_query_dto.author, rag_query_dto.category,
+                                                      rag_query_dto.description, callback_manager)
+            answer_stream = self.stream_agent_answer([query_engine], prompt, callback_manager)
+        async for message in self.stream_events(answer_stream, task_id, event_queue, rag_query_dto):
+            yield message
+
+    async def stream_events(self, answer_stream, task_id: str, event_queue: asyncio.Queue,
+                            rag_query_dto: RagQueryDTO | None = None):
+        """
+        运行回答任务，并把事件队列中的事件转换为 SSE 消息
+        """
+        running = {
             "id": task_id,
             "status": "running",
             "result": ""
-        }))
-        # 创建一个任务来发送心跳
-        heartbeat_task = asyncio.create_task(self.send_heartbeat(task_id))
+        }
+        yield format_sse(running)
+        answer_task = asyncio.create_task(self.run_stream_v2(answer_stream, task_id, event_queue, rag_query_dto))
         try:
-            res = await self.run_agent_v2([query_engine], self.llm, prompt, task_id)
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(event_queue.get(), RAG_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    # 心跳
+                    yield format_sse(running)
+                    continue
+                yield format_sse(data, event)
+                if event == "message" and data["status"] in RAG_TASK_END_STATUS:
+                    break
         finally:
-            # 当run_agent_v2返回时，取消心跳任务
-            heartbeat_task.cancel()
-            try:
-                # 等待心跳任务被取消
-                await heartbeat_task
-            except asyncio.CancelledError:
-                # 忽略取消任务引发的异常
-                pass
-        # yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps(res))
-
-
-    def get_rag_stream(self, task_id: str):
-        rag_data = self.redis_server.get(f"{RAG_TASK_REDIS_PREFIX}:{task_id}")
-        yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps(rag_data))
-        while rag_data is not None and rag_data["status"] == "running":
-            # self.logger.info(f"{json.dumps(rag_data)}")
-            yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps(rag_data))
-            time.sleep(2)
-            rag_data = self.redis_server.get(f"{RAG_TASK_REDIS_PREFIX}:{task_id}")
-
-        yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps(rag_data))
-        self.logger.info(
-            f"END RAG QUERY, task_id: {task_id}, "
-            f"status: {rag_data['status']}, response: {rag_data['result']}")
+            # 客户端断开时取消生成任务
+            if not answer_task.done():
+                answer_task.cancel()
+
+    async def query_multi(self, rag_multi_query_dto: RagMultiQueryDTO, task_id: str):
+        event_queue = asyncio.Queue()
+        callback_manager = CallbackManager([QueueCallbackHandler(task_id, event_queue, asyncio.get_running_loop())])
+        prompt = f"{BASE_PROMPT}{rag_multi_query_dto.prompt}"
+        answer_stream = self.stream_multi_answer(list(dict.fromkeys(rag_multi_query_dto.file_hashes)), prompt,
+                                                 rag_multi_query_dto.prompt, callback_manager)
+        async for message in self.stream_events(answer_stream, task_id, event_queue):
+            yield message
+
+    async def get_rag_stream(self, task_id: str):
+        channel = f"{RAG_TASK_STATUS_CHANNEL}:{task_id}"
+        key = f"{RAG_TASK_REDIS_PREFIX}:{task_id}"
+        rag_data = None
+        # 状态变化时立即推送，超时未变化时重复推送当前状态作为心跳
+        async for rag_data in AIORedisServer().watch(channel, key, RAG_HEARTBEAT_INTERVAL):
+            yield format_sse(rag_data)
+            if rag_data is None or rag_data["status"] in RAG_TASK_END_STATUS:
+                break
+
+        if rag_data is not None:
+            self.logger.info(
+                f"END RAG QUERY, task_id: {task_id}, "
+                f"status: {rag_data['status']}, response: {rag_data['result']}")
 
     def query_github(self, rag_github_dto: GithubQueryDTO):
         # Settings.embed_model = self.get_embed_model(EMBEDDING_MODEL)
@@ -274,8 +553,8 @@ class RagService:
             use_parser=False,
             verbose=True,
         ).load_data(branch=rag_github_dto.branch)
-        index = VectorStoreIndex.from_documents(documents, service_context=ServiceContext
-                                                .from_defaults(embed_model=HuggingFaceEmbedding("BAAI/bge-small-en-v1.5")))
+        index = VectorStoreIndex.from_documents(documents,
+                                                embed_model=model_registry.get_embed_model("BAAI/bge-small-en-v1.5"))
         query_engine = index.as_query_engine()
         response = query_engine.query(
             rag_github_dto.prompt,
@@ -1,22 +1,31 @@
 import json
 import os
-import torch
 import uuid
-from core.config import WHISPER_MODEL, ROCKETMQ_TOPIC
-from constants.rocketmq_tags_constants import WHISPER_TASK_STATUS_UPDATED
+import numpy as np
 import whisper
+from whisper.audio import SAMPLE_RATE
+from core.config import WHISPER_MODEL, ROCKETMQ_TOPIC, WHISPER_LONG_MEDIA_SECONDS, WHISPER_SEGMENT_CHUNK_SECONDS, \
+    WHISPER_TRANSCRIPT_CACHE_EXPIRE
+from constants.rocketmq_tags_constants import WHISPER_TASK_STATUS_UPDATED
 from model.dto import WhisperRunDTO
 from model.vo import WhisperRunVO, WhisperSubmitVO
-from utils.file_util import download_file
-from constants.whisper_constants import WHISPER_MEDIA_DIR, WHISPER_MEDIA_AUDIO_DIR, WHISPER_SRT_DIR, WHISPER_MINIO_SRT_DIR, WHISPER_TXT_DIR, WHISPER_MINIO_TXT_DIR
+from utils.file_util import download_file_async
+from constants.whisper_constants import WHISPER_MEDIA_DIR, WHISPER_MEDIA_AUDIO_DIR, WHISPER_SRT_DIR, WHISPER_MINIO_SRT_DIR, WHISPER_TXT_DIR, WHISPER_MINIO_TXT_DIR, \
+    WHISPER_TRANSCRIPT_LOCK_EXPIRE, WHISPER_END_STATUS
 import datetime
 from core.minio_server import MinioServer
 from core.aio_redis_server import AIORedisServer
 from constants.redis_channel_constants import WHISPER_STATUS_CHANNEL
 import threading
 from fastapi import BackgroundTasks
-from core.executor import executor
-from constants.redis_constants import WHISPER_STATUS
+from core.transcription_scheduler import transcription_scheduler, TranscriptionQueueFullError, INTERACTIVE, BATCH
+from core.redis_server import RedisServer
+from exceptions import BusinessException
+from core.whisper_model_pool import whisper_model_pool
+from core.redis_lock import RedisLockLease, redis_lock_watcher
+from core.chunked_transcriber import chunked_transcriber, split_at_silence, offset_result, TranscriptStitcher
+from constants.redis_constants import WHISPER_STATUS, WHISPER_TRANSCRIPT_CACHE, WHISPER_TRANSCRIPT_LOCK, \
+    WHISPER_TRANSCRIPT_FOLLOWERS
 from concurrent.futures import ThreadPoolExecutor
 
 import asyncio
@@ -24,8 +33,8 @@ import time
 
 class WhisperService:
 
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+    def __init__(self, redis_server: RedisServer):
+        self.redis_server = redis_server
         self.minio_server = MinioServer()
         os.makedirs(WHISPER_SRT_DIR, exist_ok=True)
         os.makedirs(WHISPER_TXT_DIR, exist_ok=True)
@@ -51,87 +60,227 @@ class WhisperService:
         with open(txt_file, 'w', encoding='utf-8') as f:
             f.write(result["text"])
 
-    async def run_whisper(self, whisper_run_dto: WhisperRunDTO, channel: str, status_key: str):
-        print(self.device)
-        aio_redis_server = AIORedisServer()
-        await aio_redis_server.publish(status_key, {
+    async def update_status(self, aio_redis_server: AIORedisServer, channel: str, status_key: str, status: str,
+                            result: dict | None = None):
+        message = {
             "type": "STATUS_UPDATE",
-            "status": "LOADING_MODEL",
-            "result": {}
-        })
-        await aio_redis_server.set_ex(status_key, {
-            "type": "STATUS_UPDATE",
-            "status": "LOADING_MODEL",
-            "result": {}
-        }, 3600)
-        model = whisper.load_model(WHISPER_MODEL).to(self.device)
+            "status": status,
+            "result": result or {}
+        }
+        await aio_redis_server.set_ex(status_key, message, 3600)
+        await aio_redis_server.publish(channel, message)
+
+    async def publish_segments(self, aio_redis_server: AIORedisServer, channel: str, segments: list[dict],
+                               first_index: int, duration: float):
+        """
+        逐条发布转写出的字幕片段
+
+        :param first_index: 第一条片段的序号，从 1 开始，与 SRT 序号一致
+        :param duration: 音频总时长，用于计算进度
+        """
+        for index, segment in enumerate(segments, start=first_index):
+            await aio_redis_server.publish(channel, {
+                "type": "SEGMENT",
+                "status": "RUNNING",
+                "result": {
+                    "index": index,
+                    "start": segment["start"],
+                    "end": segment["end"],
+                    "text": segment["text"].strip(),
+                    "progress": min(1.0, segment["end"] / duration) if duration else 1.0
+                }
+            })
+
+    async def transcribe_long_media(self, aio_redis_server: AIORedisServer, channel: str, audio: np.ndarray,
+                                    hash_value: str, language: str | None) -> dict:
+        """
+        按静音位置切分长音频，在进程池中并行转写，按顺序拼接并发布已完成的片段
+
+        :param audio: 解码后的音频
+        :param hash_value: 媒体文件的哈希
+        :param language: 语言
+        """
+        os.makedirs(WHISPER_MEDIA_AUDIO_DIR, exist_ok=True)
+        # 子进程通过内存映射读取各自的分段
+        audio_path = f"{WHISPER_MEDIA_AUDIO_DIR}/{hash_value}.{uuid.uuid4()}.npy"
+        np.save(audio_path, audio)
+        duration = len(audio) / SAMPLE_RATE
+        stitcher = TranscriptStitcher()
+        futures = []
+        try:
+            chunks = chunked_transcriber.split(audio)
+            # 未指定语言时只在第一段检测一次，各段使用同一种语言
+            if not language:
+                language = await asyncio.wrap_future(
+                    chunked_transcriber.detect_language(audio_path, chunks[0], WHISPER_MODEL))
+            futures = [asyncio.wrap_future(future) for future in
+                       chunked_transcriber.submit(audio_path, chunks, language, WHISPER_MODEL)]
+            # 前面的分段都完成后才发布，保证片段按时间顺序到达
+            for future in futures:
+                segments = stitcher.add(await future)
+                await self.publish_segments(aio_redis_server, channel, segments,
+                                            len(stitcher.segments) - len(segments) + 1, duration)
+        finally:
+            for future in futures:
+                future.cancel()
+            os.remove(audio_path)
+        return stitcher.result()
+
+    async def transcribe_media(self, aio_redis_server: AIORedisServer, channel: str, model, audio: np.ndarray,
+                               language: str | None) -> dict:
+        """
+        按静音位置切成较短的分段依次转写，每段完成后发布片段，前一段的文本作为下一段的提示保持上下文
+        """
+        duration = len(audio) / SAMPLE_RATE
+        stitcher = TranscriptStitcher()
+        for start, end in split_at_silence(audio, WHISPER_SEGMENT_CHUNK_SECONDS):
+            result = model.transcribe(audio[start:end], language=language, initial_prompt=stitcher.prompt())
+            # 未指定语言时沿用第一段检测出的语言，后续分段不再重复检测
+            language = language or result["language"]
+            segments = stitcher.add(offset_result(result, start))
+            await self.publish_segments(aio_redis_server, channel, segments,
+                                        len(stitcher.segments) - len(segments) + 1, duration)
+        return stitcher.result()
+
+    def transcript_cache_key(self, hash_value: str, language: str | None) -> str:
+        return f"{hash_value}:{language or 'auto'}:{WHISPER_MODEL}"
+
+    def get_cached_transcript(self, cache_key: str) -> WhisperRunVO | None:
+        """
+        读取已完成的转写结果，重新生成 MinIO 对象的下载链接
+        """
+        entry = self.redis_server.get(f"{WHISPER_TRANSCRIPT_CACHE}:{cache_key}")
+        if not entry:
+            return None
+        return WhisperRunVO(text=entry["text"], srt=self.minio_server.presigned_url(entry["srt"]),
+                            txt=self.minio_server.presigned_url(entry["txt"]))
+
+    async def attach_whisper_task(self, aio_redis_server: AIORedisServer, whisper_run_dto: WhisperRunDTO,
+                                  channel: str, status_key: str, priority: int, cache_key: str):
+        """
+        相同媒体正在转写时不再重复转写，等待该任务完成后一起返回结果。
+        转写任务所在进程退出时锁很快过期，由 redis_lock_watcher 重新提交等待的任务
+        """
+        await self.update_status(aio_redis_server, channel, status_key, "WAITING")
+        lock_key = f"{WHISPER_TRANSCRIPT_LOCK}:{cache_key}"
+        followers_key = f"{WHISPER_TRANSCRIPT_FOLLOWERS}:{cache_key}"
+        member = json.dumps({"channel": channel, "status_key": status_key})
+        self.redis_server.sadd(followers_key, member)
+        # 转写任务可能在加入等待集合前已经结束
+        if self.redis_server.get(lock_key) is None:
+            await self.finish_attached_whisper_tasks(aio_redis_server, cache_key)
+            return
+        redis_lock_watcher.watch(self.redis_server, lock_key, followers_key, member,
+                                 lambda: self.retry_whisper_task(whisper_run_dto, channel, status_key, priority))
+
+    def retry_whisper_task(self, whisper_run_dto: WhisperRunDTO, channel: str, status_key: str, priority: int):
+        """
+        重新提交等待中的任务，命中缓存、接手转写或继续等待新的转写任务
+        """
+        try:
+            self.schedule_whisper(whisper_run_dto, channel, status_key, priority)
+        except TranscriptionQueueFullError:
+            message = {
+                "type": "STATUS_UPDATE",
+                "status": "FAILED",
+                "result": {"message": "转写任务队列已满，请稍后重试"}
+            }
+            self.redis_server.set_ex(status_key, message, 3600)
+            self.redis_server.publish(channel, message)
+
+    async def finish_attached_whisper_tasks(self, aio_redis_server: AIORedisServer, cache_key: str):
+        followers = self.redis_server.pop_members(f"{WHISPER_TRANSCRIPT_FOLLOWERS}:{cache_key}")
+        if not followers:
+            return
+        transcript = self.get_cached_transcript(cache_key)
+        for follower in map(json.loads, followers):
+            if transcript is None:
+                await self.update_status(aio_redis_server, follower["channel"], follower["status_key"], "FAILED")
+            else:
+                await self.update_status(aio_redis_server, follower["channel"], follower["status_key"], "FINISHED",
+                                         transcript.to_dict())
+
+    async def run_whisper(self, whisper_run_dto: WhisperRunDTO, channel: str, status_key: str,
+                          priority: int = BATCH):
+        aio_redis_server = AIORedisServer()
         # RocketMQServer().send(ROCKETMQ_TOPIC, WHISPER_TASK_STATUS_UPDATED, {
         #     "status": "downloading"
         # })
-
-        await aio_redis_server.set_ex(status_key, {
-            "type": "STATUS_UPDATE",
-            "status": "DOWNLOADING",
-            "result": {}
-        }, 3600)
-        await AIORedisServer().publish(channel, {
-            "type": "STATUS_UPDATE",
-            "status": "DOWNLOADING",
-            "result": {}
-        })
-        print("DOWNLOADING----------------------")
-        audio_file = download_file(whisper_run_dto.url, WHISPER_MEDIA_DIR)
+        await self.update_status(aio_redis_server, channel, status_key, "DOWNLOADING")
+        audio_file = await download_file_async(whisper_run_dto.url, WHISPER_MEDIA_DIR)
+        if audio_file is None:
+            await self.update_status(aio_redis_server, channel, status_key, "FAILED", {"message": "下载文件失败"})
+            return
         # audio_path = f"{WHISPER_MEDIA_AUDIO_DIR}/{audio_file.hash_value}.mp3"
         # extract_sound(audio_file.file_path, audio_path)
-        # audio = whisper.load_audio(audio_file.file_path)
-        # audio = whisper.pad_or_trim(audio)
-        # mel = whisper.log_mel_spectrogram(audio).to(model.device).to(self.device)
-        # _, probs = model.detect_language(mel)
-        # print(f"Detected language: {max(probs, key=probs.get)}")
-        # options = whisper.DecodingOptions(language=whisper_run_dto.language)
-        # result = whisper.decode(model, mel, options)
-        await aio_redis_server.set_ex(status_key, {
-            "type": "STATUS_UPDATE",
-            "status": "RUNNING",
-            "result": {}
-        }, 3600)
-        await AIORedisServer().publish(channel, {
-            "type": "STATUS_UPDATE",
-            "status": "RUNNING",
-            "result": {}
-        })
 
-        # RocketMQServer().send(ROCKETMQ_TOPIC, WHISPER_TASK_STATUS_UPDATED, {
-        #     "status": "running"
-        # })
-        result = model.transcribe(audio_file.file_path, language=whisper_run_dto.language)
+        # 相同内容、语言和模型的媒体只转写一次
+        cache_key = self.transcript_cache_key(audio_file.hash_value, whisper_run_dto.language)
+        transcript = self.get_cached_transcript(cache_key)
+        if transcript is not None:
+            await self.update_status(aio_redis_server, channel, status_key, "FINISHED", transcript.to_dict())
+            return
+        lock_key = f"{WHISPER_TRANSCRIPT_LOCK}:{cache_key}"
+        if not self.redis_server.set_nx_ex(lock_key, channel, WHISPER_TRANSCRIPT_LOCK_EXPIRE):
+            await self.attach_whisper_task(aio_redis_server, whisper_run_dto, channel, status_key, priority,
+                                           cache_key)
+            return
+        try:
+            # 转写期间定时续期，退出时释放锁
+            with RedisLockLease(self.redis_server, lock_key, channel, WHISPER_TRANSCRIPT_LOCK_EXPIRE):
+                # 加锁前上一个转写任务可能刚好完成
+                transcript = self.get_cached_transcript(cache_key)
+                if transcript is None:
+                    transcript = await self.transcribe_and_upload(aio_redis_server, channel, status_key,
+                                                                  audio_file, whisper_run_dto.language, cache_key)
+            # RocketMQServer().send(ROCKETMQ_TOPIC, WHISPER_TASK_STATUS_UPDATED, {
+            #     "status": "finished",
+            #     "data": transcript.to_dict()
+            # })
+            await self.update_status(aio_redis_server, channel, status_key, "FINISHED", transcript.to_dict())
+        except Exception:
+            await self.update_status(aio_redis_server, channel, status_key, "FAILED")
+            raise
+        finally:
+            await self.finish_attached_whisper_tasks(aio_redis_server, cache_key)
+
+    async def transcribe_and_upload(self, aio_redis_server: AIORedisServer, channel: str, status_key: str,
+                                    audio_file, language: str | None, cache_key: str) -> WhisperRunVO:
+        """
+        转写并上传 SRT 和 TXT 文件，结果写入转写缓存
+        """
+        # 只解码一次，长音频的各个分段从解码结果中读取
+        audio = whisper.load_audio(audio_file.file_path)
+        if len(audio) > WHISPER_LONG_MEDIA_SECONDS * SAMPLE_RATE:
+            # 每个子进程占用一个计算名额，与工作线程共享 CPU 核数预算
+            with transcription_scheduler.reserve(chunked_transcriber.processes):
+                await self.update_status(aio_redis_server, channel, status_key, "RUNNING")
+                result = await self.transcribe_long_media(aio_redis_server, channel, audio, audio_file.hash_value,
+                                                          language)
+        else:
+            # 模型池中有空闲实例时跳过 LOADING_MODEL
+            with whisper_model_pool.lend(WHISPER_MODEL) as lease:
+                if lease.cold:
+                    await self.update_status(aio_redis_server, channel, status_key, "LOADING_MODEL")
+                    lease.load()
+                await self.update_status(aio_redis_server, channel, status_key, "RUNNING")
+                # RocketMQServer().send(ROCKETMQ_TOPIC, WHISPER_TASK_STATUS_UPDATED, {
+                #     "status": "running"
+                # })
+                result = await self.transcribe_media(aio_redis_server, channel, lease.model, audio, language)
         srt_file = f"{WHISPER_SRT_DIR}/{audio_file.hash_value}.srt"
         txt_file = f"{WHISPER_TXT_DIR}/{audio_file.hash_value}.txt"
         self.save_srt(result, srt_file)
         self.save_txt(result, txt_file)
-        srt_url = self.minio_server.upload(srt_file, f"{WHISPER_MINIO_SRT_DIR}/{audio_file.hash_value}.srt")
-        txt_url = self.minio_server.upload(txt_file, f"{WHISPER_MINIO_TXT_DIR}/{audio_file.hash_value}.txt")
-        # print(json.dumps(result, indent=2))
-        # RocketMQServer().send(ROCKETMQ_TOPIC, WHISPER_TASK_STATUS_UPDATED, {
-        #     "status": "finished",
-        #     "data": WhisperRunVO(text=result["text"],
-        #                             srt=srt_url,
-        #                             txt=txt_url).to_dict()
-        # })
-        await aio_redis_server.set_ex(status_key, {
-            "type": "STATUS_UPDATE",
-            "status": "FINISHED",
-            "result": WhisperRunVO(text=result["text"],
-                                    srt=srt_url,
-                                    txt=txt_url).to_dict()
-        }, 3600)
-        await AIORedisServer().publish(channel, {
-            "type": "STATUS_UPDATE",
-            "status": "FINISHED",
-            "result": WhisperRunVO(text=result["text"],
-                                    srt=srt_url,
-                                    txt=txt_url).to_dict()
-        })
+        srt_object = f"{WHISPER_MINIO_SRT_DIR}/{audio_file.hash_value}.srt"
+        txt_object = f"{WHISPER_MINIO_TXT_DIR}/{audio_file.hash_value}.txt"
+        srt_url = self.minio_server.upload(srt_file, srt_object)
+        txt_url = self.minio_server.upload(txt_file, txt_object)
+        # 缓存保存对象路径，命中时重新生成下载链接
+        self.redis_server.set_ex(f"{WHISPER_TRANSCRIPT_CACHE}:{cache_key}",
+                                 {"text": result["text"], "srt": srt_object, "txt": txt_object},
+                                 WHISPER_TRANSCRIPT_CACHE_EXPIRE)
+        return WhisperRunVO(text=result["text"], srt=srt_url, txt=txt_url)
 
 
     def on_whisper_status_message(self, message):
@@ -155,22 +304,42 @@ class WhisperService:
             #     await self.aio_redis_server.publish(channel, status)
 
 
-    def start_whisper(self, whisper_run_dto, channel, status_key: str):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        run_whisper_task = loop.run_until_complete(self.run_whisper(whisper_run_dto, channel, status_key))
-        # run_whisper_task = asyncio.create_task(self.run_whisper(whisper_run_dto, channel))
+    def publish_queue_position(self, channel: str, status_key: str, position: int | None = None):
+        message = {
+            "type": "STATUS_UPDATE",
+            "status": "QUEUED",
+            "result": {"position": position} if position is not None else {}
+        }
+        self.redis_server.set_ex(status_key, message, 3600)
+        self.redis_server.publish(channel, message)
+
+    def schedule_whisper(self, whisper_run_dto: WhisperRunDTO, channel: str, status_key: str, priority: int) -> int:
+        """
+        提交到转写调度器，排队位置变化时发布 QUEUED 状态
+
+        :return: 当前排队位置
+        """
+        # 入队前写入 QUEUED，工作线程立即开始执行时不会被覆盖
+        self.publish_queue_position(channel, status_key)
+        try:
+            return transcription_scheduler.submit(
+                channel,
+                lambda: self.run_whisper(whisper_run_dto, channel, status_key, priority),
+                priority,
+                lambda position: self.publish_queue_position(channel, status_key, position)
+            )
+        except TranscriptionQueueFullError:
+            self.redis_server.delete(status_key)
+            raise
 
     async def submit_whisper_task(self, whisper_run_dto: WhisperRunDTO):
         task_id = uuid.uuid4().__str__()
         channel = f"{WHISPER_STATUS_CHANNEL}:{task_id}"
         status_key = f"{WHISPER_STATUS}:{task_id}"
-        await self.aio_redis_server.set_ex(status_key, {
-            "status": "STARTING",
-            "data": {}
-        }, 3600)
-        executor.submit(self.start_whisper, whisper_run_dto, channel, status_key)
-        # run_whisper_task = asyncio.create_task(self.run_whisper(whisper_run_dto, channel))
+        try:
+            self.schedule_whisper(whisper_run_dto, channel, status_key, BATCH)
+        except TranscriptionQueueFullError:
+            raise BusinessException("转写任务队列已满，请稍后重试")
         return WhisperSubmitVO(task_id=task_id)
 
 
@@ -178,17 +347,22 @@ class WhisperService:
         task_id = uuid.uuid4().__str__()
         channel = f"{WHISPER_STATUS_CHANNEL}:{task_id}"
         status_key = f"{WHISPER_STATUS}:{task_id}"
-        await self.aio_redis_server.set_ex(status_key, {
-            "status": "DOWNLOADING",
-            "data": {}
-        }, 3600)
-        executor.submit(self.start_whisper, whisper_run_dto, channel, status_key)
+        try:
+            self.schedule_whisper(whisper_run_dto, channel, status_key, INTERACTIVE)
+        except TranscriptionQueueFullError:
+            yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps({
+                "type": "STATUS_UPDATE",
+                "status": "REJECTED",
+                "result": {"message": "转写任务队列已满，请稍后重试"}
+            }))
+            return
         heartbeat_task = asyncio.create_task(self.heartbeat(channel, status_key))
         try:
-            async for message in AIORedisServer().subscribe(channel):
+            # 先订阅再读取当前状态，不会漏掉订阅前已经发布的状态
+            async for message in AIORedisServer().watch(channel, status_key):
                 yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps(message))
                 print("STATUS:" + message["status"])
-                if message["status"] == "FINISHED":
+                if message["status"] in WHISPER_END_STATUS:
                     break
         except asyncio.CancelledError:
             # run_whisper_task.cancel()
@@ -205,13 +379,12 @@ class WhisperService:
     async def get_whisper_task_status(self, task_id):
         channel = f"{WHISPER_STATUS_CHANNEL}:{task_id}"
         status_key = f"{WHISPER_STATUS}:{task_id}"
-        status = await AIORedisServer().get(status_key)
-        yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps(status))
         heartbeat_task = asyncio.create_task(self.heartbeat(channel, status_key))
         try:
-            async for message in AIORedisServer().subscribe(channel):
+            # 第一条为当前状态，之后转发频道中的状态和 SEGMENT 消息
+            async for message in AIORedisServer().watch(channel, status_key):
                 yield 'id: {}\nevent: message\ndata: {}\n\n'.format(int(time.time()), json.dumps(message))
-                if message["status"] == "FINISHED":
+                if message is None or message["status"] in WHISPER_END_STATUS:
                     heartbeat_task.cancel()
                     break
         except asyncio.CancelledError:
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from whisper.audio import SAMPLE_RATE
+
+from core.chunked_transcriber import split_at_silence, offset_result, stitch, TranscriptStitcher, FRAME_SIZE
+
+
+def speech(seconds: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.uniform(-0.5, 0.5, int(seconds * SAMPLE_RATE)).astype(np.float32)
+
+
+def test_split_short_audio_is_one_chunk():
+    audio = speech(10)
+    assert split_at_silence(audio, 30) == [(0, len(audio))]
+
+
+def test_split_chunks_are_contiguous_and_bounded():
+    audio = speech(100)
+    chunks = split_at_silence(audio, 30, search_seconds=5)
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == len(audio)
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start
+    assert all(end - start <= 30 * SAMPLE_RATE for start, end in chunks)
+
+
+def test_split_cuts_at_silence():
+    audio = speech(40)
+    silence_start = 27 * SAMPLE_RATE
+    audio[silence_start:silence_start + SAMPLE_RATE] = 0
+    (_, cut), _ = split_at_silence(audio, 30, search_seconds=5)
+    assert silence_start <= cut < silence_start + SAMPLE_RATE + FRAME_SIZE
+
+
+def test_offset_result_shifts_timestamps_and_drops_other_fields():
+    result = {"text": " hi", "language": "en",
+              "segments": [{"start": 0.5, "end": 1.0, "text": " hi", "tokens": [1, 2]}]}
+    shifted = offset_result(result, 2 * SAMPLE_RATE)
+    assert shifted == {"text": " hi", "segments": [{"start": 2.5, "end": 3.0, "text": " hi"}]}
+
+
+def test_stitch_keeps_speech_repeated_across_a_cut():
+    first = {"text": " Thank you.", "segments": [{"start": 0.0, "end": 1.0, "text": " Thank you."}]}
+    second = {"text": " Thank you. Next slide",
+              "segments": [{"start": 1.0, "end": 2.0, "text": " Thank you. Next slide"}]}
+    assert stitch([first, second])["text"] == " Thank you. Thank you. Next slide"
+
+
+def test_stitcher_returns_new_segments_and_prompt():
+    stitcher = TranscriptStitcher()
+    segments = [{"start": 0.0, "end": 1.0, "text": " one, two, three"}]
+    assert stitcher.add({"text": " one, two, three", "segments": segments}) == segments
+    assert stitcher.prompt(max_chars=5) == "three"
+    assert TranscriptStitcher().prompt() is None
+
+
+@pytest.mark.parametrize("seconds", [0.5, 30, 61])
+def test_split_covers_every_sample(seconds):
+    audio = speech(seconds)
+    chunks = split_at_silence(audio, 30, search_seconds=5)
+    assert sum(end - start for start, end in chunks) == len(audio)
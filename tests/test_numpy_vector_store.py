@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from core.numpy_vector_store import NumpyVectorStore
+
+
+@pytest.mark.parametrize("quantization", ["none", "float16", "int8"])
+def test_persist_load_query_round_trip(tmp_path, quantization):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(50, 16)).astype(np.float32)
+    embedding_dict = {f"node-{i}": embedding.tolist() for i, embedding in enumerate(embeddings)}
+    ref_doc_id_dict = {node_id: "doc" for node_id in embedding_dict}
+    store = NumpyVectorStore.from_embedding_dict(embedding_dict, ref_doc_id_dict)
+    store.quantization = quantization
+    store.persist(str(tmp_path / "default__vector_store.json"))
+
+    loaded = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    result = loaded.query(VectorStoreQuery(query_embedding=embeddings[7].tolist(), similarity_top_k=3))
+
+    assert result.ids[0] == "node-7"
+    assert result.similarities[0] == pytest.approx(1.0, abs=1e-3)
+    assert len(result.ids) == 3
+
+
+def test_unknown_quantization_is_rejected():
+    with pytest.raises(ValueError):
+        NumpyVectorStore(quantization="int4")
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from core.transcription_scheduler import TranscriptionScheduler
+
+
+def wait_until(predicate, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def reserving_job(scheduler: TranscriptionScheduler, slots: int, samples: list, done: threading.Event):
+    async def run():
+        with scheduler.reserve(slots):
+            samples.append(scheduler.stats()["used"])
+            time.sleep(0.05)
+        done.set()
+
+    return run
+
+
+@pytest.mark.parametrize("jobs", [1, 2, 3])
+def test_reserving_jobs_do_not_deadlock_or_oversubscribe(jobs):
+    scheduler = TranscriptionScheduler(2, 1, 10)
+    samples = []
+    done = [threading.Event() for _ in range(jobs)]
+    for i, event in enumerate(done):
+        scheduler.submit(f"job-{i}", reserving_job(scheduler, 2, samples, event))
+
+    assert all(event.wait(5) for event in done)
+    assert samples == [2] * jobs
+    assert wait_until(lambda: scheduler.stats()["used"] == 0 and scheduler.stats()["running"] == 0)
+
+
+def test_reserve_is_capped_at_capacity():
+    scheduler = TranscriptionScheduler(2, 1, 10)
+    samples = []
+    done = threading.Event()
+    scheduler.submit("job", reserving_job(scheduler, 5, samples, done))
+
+    assert done.wait(5)
+    assert samples == [2]
+    assert wait_until(lambda: scheduler.stats()["used"] == 0)
+
+
+def test_queued_job_waits_for_reserved_slots():
+    scheduler = TranscriptionScheduler(2, 1, 10)
+    reserved = threading.Event()
+    release = threading.Event()
+    started = threading.Event()
+
+    async def reserving():
+        with scheduler.reserve(2):
+            reserved.set()
+            release.wait(5)
+
+    async def plain():
+        started.set()
+
+    scheduler.submit("reserving", reserving)
+    assert reserved.wait(5)
+    scheduler.submit("plain", plain)
+    assert not started.wait(0.2)
+    assert scheduler.stats()["used"] == 2
+
+    release.set()
+    assert started.wait(5)
+    assert wait_until(lambda: scheduler.stats()["used"] == 0)
@@ -1 +1 @@
-from .file_util import download_file
+from .file_util import download_file, download_file_async
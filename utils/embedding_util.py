@@ -0,0 +1,39 @@
+from typing import Callable
+
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from core.embedding_cache import embedding_cache
+
+
+def embed_nodes(embed_model, nodes: list[BaseNode], progress_callback: Callable[[int, int], None] | None = None):
+    """
+    分批计算节点向量并写入 node.embedding，构建索引时不会再重复计算。
+    先查询向量缓存，只对未命中的文本调用 Embedding 模型。
+
+    :param embed_model: Embedding 模型
+    :param nodes: 需要计算向量的节点
+    :param progress_callback: 进度回调，参数为 (已完成数量, 总数量)
+    """
+    total = len(nodes)
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    cached_embeddings = embedding_cache.get_many(embed_model.model_name, texts)
+    missing = []
+    for node, embedding in zip(nodes, cached_embeddings):
+        if embedding is None:
+            missing.append(node)
+        else:
+            node.embedding = embedding
+    missing_texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in missing]
+    done = total - len(missing)
+    if progress_callback is not None:
+        progress_callback(done, total)
+
+    batch_size = embed_model.embed_batch_size
+    for start in range(0, len(missing), batch_size):
+        end = min(start + batch_size, len(missing))
+        embeddings = embed_model.get_text_embedding_batch(missing_texts[start:end])
+        embedding_cache.put_many(embed_model.model_name, missing_texts[start:end], embeddings)
+        for node, embedding in zip(missing[start:end], embeddings):
+            node.embedding = embedding
+        if progress_callback is not None:
+            progress_callback(done + end, total)
@@ -1,9 +1,23 @@
-import requests
 import hashlib
 import os
 import uuid
+
+import httpx
+
+from core.config import DOWNLOAD_CHUNK_SIZE, DOWNLOAD_MAX_SIZE, DOWNLOAD_MAX_RETRIES
+from core.http_client import http_client
+from core.download_catalog import download_catalog
+from core.logger import get_logger
 from model.dto import FileDownloadDTO
-from urllib.parse import urlparse, urlunparse
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+# 预签名参数，每次签名都不同，不参与缓存 key
+PRESIGNED_QUERY_PREFIX = "x-amz-"
+
+
+class DownloadError(Exception):
+    pass
+
 
 def remove_query_params(url):
     parsed_url = urlparse(url)
@@ -14,33 +28,109 @@ def remove_query_params(url):
     return cleaned_url
 
 
+def catalog_key(url: str) -> str:
+    """
+    去掉预签名参数(X-Amz-*)的 URL，其余查询参数保留，只差查询参数的不同资源不会共用下载记录
+    """
+    parsed_url = urlparse(url)
+    query = [(key, value) for key, value in parse_qsl(parsed_url.query, keep_blank_values=True)
+             if not key.lower().startswith(PRESIGNED_QUERY_PREFIX)]
+    return urlunparse(parsed_url._replace(query=urlencode(query)))
+
+
+async def stream_to_file(url: str, file_path: str, headers: dict) -> tuple[str, httpx.Headers] | None:
+    """
+    流式下载到文件，同时计算 SHA-256。连接中断且服务器支持 Range 时从已下载位置继续。
+
+    :param headers: 额外的请求头，用于条件请求
+    :return: (SHA-256, 响应头)，服务器返回 304 时为 None
+    """
+    sha256_hash = hashlib.sha256()
+    downloaded = 0
+    retries = 0
+    resumable = False
+    response_headers = None
+    while True:
+        request_headers = {"Range": f"bytes={downloaded}-"} if downloaded else headers
+        try:
+            async with http_client.client.stream("GET", url, headers=request_headers) as r:
+                if r.status_code == 304:
+                    return None
+                r.raise_for_status()
+                if downloaded and r.status_code != 206:
+                    # 服务器忽略了 Range，重新下载
+                    sha256_hash = hashlib.sha256()
+                    downloaded = 0
+                if not downloaded:
+                    response_headers = r.headers
+                    resumable = r.headers.get("accept-ranges") == "bytes"
+                    content_length = int(r.headers.get("content-length", 0))
+                    if content_length > DOWNLOAD_MAX_SIZE:
+                        raise DownloadError(f"File too large: {content_length} bytes")
+                with open(file_path, 'ab' if downloaded else 'wb') as f:
+                    async for chunk in r.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        downloaded += len(chunk)
+                        if downloaded > DOWNLOAD_MAX_SIZE:
+                            raise DownloadError(f"File exceeds {DOWNLOAD_MAX_SIZE} bytes")
+                        sha256_hash.update(chunk)
+                        f.write(chunk)
+            return sha256_hash.hexdigest(), response_headers
+        except httpx.TransportError:
+            if not resumable or retries >= DOWNLOAD_MAX_RETRIES:
+                raise
+            retries += 1
+            get_logger().warning(f"Download interrupted at {downloaded} bytes, resuming: {url}")
+
+
+async def async_download_file(url: str, dest_folder: str) -> FileDownloadDTO:
+    # 确保目标文件夹存在
+    os.makedirs(dest_folder, exist_ok=True)
+    # 预签名 URL 每次的签名参数不同，使用去掉签名参数的 URL 作为 key，是否变化由条件请求判断
+    cleaned_url = catalog_key(url)
+    entry = download_catalog.get(cleaned_url, dest_folder)
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    part_path = os.path.join(dest_folder, f"{uuid.uuid4()}.part")
+    try:
+        result = await stream_to_file(url, part_path, headers)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    if result is None:
+        return FileDownloadDTO(file_path=entry["file_path"], hash_value=entry["hash_value"])
+
+    # 按内容哈希命名，相同内容只保留一份
+    hash_value, response_headers = result
+    file_path = os.path.join(dest_folder, f"{hash_value}.{remove_query_params(url).split('.')[-1]}")
+    if os.path.exists(file_path):
+        os.remove(part_path)
+    else:
+        os.replace(part_path, file_path)
+    download_catalog.put(cleaned_url, dest_folder, response_headers.get("etag"),
+                         response_headers.get("last-modified"), hash_value, file_path)
+    return FileDownloadDTO(file_path=file_path, hash_value=hash_value)
+
+
+async def download_file_async(url: str, dest_folder: str) -> FileDownloadDTO | None:
+    """
+    供其他事件循环中的协程调用，下载在共享连接池所在的事件循环中执行
+    """
+    try:
+        return await http_client.run(async_download_file(url, dest_folder))
+    except Exception:
+        get_logger().exception(f"Download failed: {remove_query_params(url)}")
+        return None
+
+
 def download_file(url: str, dest_folder: str) -> FileDownloadDTO | None:
     try:
-        # 确保目标文件夹存在
-        os.makedirs(dest_folder, exist_ok=True)
-
-
-        cleaned_url = remove_query_params(url)
-        print(cleaned_url)
-        # 从URL中提取文件名
-        file_name = f"{uuid.uuid4()}.{cleaned_url.split('.')[-1]}"
-        file_path = os.path.join(dest_folder, file_name)
-
-        # 下载文件
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            with open(file_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-        # 计算SHA-256哈希值
-        sha256_hash = hashlib.sha256()
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(chunk)
-        hash_value = sha256_hash.hexdigest()
-
-        return FileDownloadDTO(file_path=file_path, hash_value=hash_value)
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        return http_client.submit(async_download_file(url, dest_folder)).result()
+    except Exception:
+        get_logger().exception(f"Download failed: {remove_query_params(url)}")
         return None
@@ -0,0 +1,6 @@
+import json
+import time
+
+
+def format_sse(data, event: str = "message") -> str:
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(int(time.time()), event, json.dumps(data))